@@ -0,0 +1,189 @@
+"""Control de admisión y descarte de carga.
+
+Cuando llegan más subidas de las que se pueden procesar, los requests se
+acumulan hasta que el cliente corta y el trabajo hecho se pierde. El
+controlador lleva la cuenta del trabajo en curso y del tiempo de servicio
+estimado por clase, y responde 503 con Retry-After en cuanto la espera en cola
+superaría el objetivo de latencia. Las consultas interactivas de corredores
+tienen prioridad y un cupo reservado frente a las subidas masivas de fotos.
+Los lotes de /detect-batch son una clase aparte, con su propio tiempo de
+servicio, para que un lote de 50 fotos no haga descartar subidas individuales.
+"""
+import asyncio
+import itertools
+import math
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi.responses import JSONResponse
+
+from config import (
+    ADMISSION_EWMA_ALPHA,
+    ADMISSION_INITIAL_SERVICE_TIME,
+    ADMISSION_LATENCY_TARGETS,
+    ADMISSION_MAX_CONCURRENCY,
+    ADMISSION_RESERVED_INTERACTIVE,
+)
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+BATCH = "batch"
+
+# Orden de atención: primero las consultas interactivas, al final los lotes
+PRIORITY_RANK = {INTERACTIVE: 0, BULK: 1, BATCH: 2}
+
+
+class Overloaded(Exception):
+    """La espera estimada supera el objetivo de latencia"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Servidor saturado, reintentar en {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Limita el trabajo en curso y descarta requests que esperarían demasiado"""
+
+    def __init__(self, max_concurrency: int = ADMISSION_MAX_CONCURRENCY,
+                 reserved_interactive: int = ADMISSION_RESERVED_INTERACTIVE,
+                 latency_targets: Optional[Dict[str, float]] = None,
+                 initial_service_time: Optional[Dict[str, float]] = None,
+                 ewma_alpha: float = ADMISSION_EWMA_ALPHA):
+        self.max_concurrency = max_concurrency
+        self.reserved_interactive = min(reserved_interactive, max_concurrency - 1)
+        self.latency_targets = dict(latency_targets or ADMISSION_LATENCY_TARGETS)
+        self.service_time = dict(initial_service_time or ADMISSION_INITIAL_SERVICE_TIME)
+        self.ewma_alpha = ewma_alpha
+        self.in_flight = {priority: 0 for priority in PRIORITY_RANK}
+        self.rejected = {priority: 0 for priority in PRIORITY_RANK}
+        # (rango, orden de llegada, clase, future) ordenados por prioridad
+        self._waiters: List[Tuple[int, int, str, asyncio.Future]] = []
+        self._sequence = itertools.count()
+
+    def _can_run(self, priority: str) -> bool:
+        total = sum(self.in_flight.values())
+        if total >= self.max_concurrency:
+            return False
+        # Las subidas y los lotes no pueden ocupar los lugares reservados
+        if priority != INTERACTIVE:
+            return total - self.in_flight[INTERACTIVE] < self.max_concurrency - self.reserved_interactive
+        return True
+
+    def estimated_wait(self, priority: str) -> float:
+        """Segundos que esperaría un request nuevo de esta clase antes de empezar"""
+        rank = PRIORITY_RANK[priority]
+        ahead = [p for r, _, p, _ in self._waiters if r <= rank]
+        if not ahead and self._can_run(priority):
+            return 0.0
+
+        # Lo que está en curso le queda, en promedio, la mitad de su tiempo de servicio
+        queued = sum(self.service_time[p] for p in ahead)
+        residuals = [self.service_time[p] / 2 for p, count in self.in_flight.items() for _ in range(count)]
+
+        if priority == INTERACTIVE:
+            # Cualquier lugar que se libere sirve: alcanza con el primero que termine
+            return min(residuals, default=0.0) + queued / self.max_concurrency
+
+        slots = max(1, self.max_concurrency - self.reserved_interactive)
+        return (queued + sum(residuals)) / slots
+
+    async def acquire(self, priority: str):
+        """Esperar un lugar para ejecutar o lanzar Overloaded si la espera sería excesiva"""
+        wait = self.estimated_wait(priority)
+        if wait > self.latency_targets[priority]:
+            self.rejected[priority] += 1
+            raise Overloaded(max(1, math.ceil(wait)))
+
+        # Sin nadie de igual o mayor prioridad esperando, entrar directamente
+        rank = PRIORITY_RANK[priority]
+        if not any(r <= rank for r, _, _, _ in self._waiters) and self._can_run(priority):
+            self.in_flight[priority] += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (PRIORITY_RANK[priority], next(self._sequence), priority, future)
+        self._waiters.append(entry)
+        self._waiters.sort(key=lambda w: w[:2])
+        try:
+            await future
+        except asyncio.CancelledError:
+            # El cliente se fue: devolver el lugar si ya se le había asignado
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+            elif future.done() and not future.cancelled():
+                self.release(priority, None)
+            raise
+
+    def release(self, priority: str, elapsed: Optional[float]):
+        """Liberar un lugar y actualizar el tiempo de servicio estimado"""
+        self.in_flight[priority] -= 1
+        if elapsed is not None:
+            alpha = self.ewma_alpha
+            self.service_time[priority] = (1 - alpha) * self.service_time[priority] + alpha * elapsed
+
+        # Despertar a los que esperan, respetando la prioridad
+        for entry in list(self._waiters):
+            _, _, waiter_priority, future = entry
+            if not self._can_run(waiter_priority):
+                continue
+            self._waiters.remove(entry)
+            if not future.done():
+                self.in_flight[waiter_priority] += 1
+                future.set_result(None)
+
+    def status(self) -> dict:
+        return {
+            "in_flight": dict(self.in_flight),
+            "waiting": len(self._waiters),
+            "service_time_seconds": {p: round(t, 3) for p, t in self.service_time.items()},
+            "estimated_wait_seconds": {p: round(self.estimated_wait(p), 3) for p in PRIORITY_RANK},
+            "rejected": dict(self.rejected),
+        }
+
+
+def classify_request(method: str, path: str) -> Optional[str]:
+    """Clase de prioridad de un request, o None si no pasa por el control de admisión"""
+    if method == "POST" and path == "/detect-batch":
+        return BATCH
+    if method == "POST" and path in ("/detect-plate", "/debug-detect"):
+        return BULK
+    if method == "GET" and (path == "/runners" or path.startswith(("/runners/", "/photos/", "/detections/"))):
+        return INTERACTIVE
+    return None
+
+
+class AdmissionMiddleware:
+    """Middleware ASGI que aplica el control de admisión"""
+
+    def __init__(self, app, controller: AdmissionController,
+                 classify: Callable[[str, str], Optional[str]] = classify_request):
+        self.app = app
+        self.controller = controller
+        self.classify = classify
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        priority = self.classify(scope["method"], scope["path"])
+        if priority is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.controller.acquire(priority)
+        except Overloaded as e:
+            response = JSONResponse(
+                status_code=503,
+                content={"message": "Servidor saturado, reintentar más tarde", "retry_after": e.retry_after},
+                headers={"Retry-After": str(e.retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(priority, loop.time() - start)
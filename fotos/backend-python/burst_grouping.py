@@ -0,0 +1,114 @@
+"""Agrupamiento de ráfagas de fotos casi idénticas.
+
+Los fotógrafos disparan ráfagas de 10 fps, así que los mismos corredores
+aparecen en decenas de fotos casi iguales. Las fotos consecutivas se agrupan
+por la hora EXIF y un hash perceptual barato (dHash); de cada grupo sólo se
+procesa la foto más nítida (varianza del Laplaciano) y sus dorsales se
+propagan al resto de la ráfaga.
+
+Con una cámara fija el fondo domina el hash y fotos de corredores distintos se
+parecen, así que el hash solo no alcanza: una foto sin hora de captura nunca se
+agrupa, y cada foto se compara con la anterior y con la primera de la ráfaga
+para que una serie larga no se desplace de a poco hacia otra escena.
+"""
+import io
+from datetime import datetime
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+from config import BURST_HASH_DISTANCE, BURST_MAX_GAP_SECONDS
+
+# Etiquetas EXIF
+EXIF_IFD = 0x8769
+DATETIME_ORIGINAL = 36867
+SUBSEC_TIME_ORIGINAL = 37521
+DATETIME = 306
+
+
+def exif_timestamp(contents: bytes) -> Optional[float]:
+    """Hora de captura según EXIF, en segundos (con fracción si la cámara la informa)"""
+    from PIL import Image
+
+    try:
+        exif = Image.open(io.BytesIO(contents)).getexif()
+        ifd = exif.get_ifd(EXIF_IFD)
+        value = ifd.get(DATETIME_ORIGINAL) or exif.get(DATETIME)
+        if not value:
+            return None
+        timestamp = datetime.strptime(str(value).strip(), "%Y:%m:%d %H:%M:%S").timestamp()
+        subsec = str(ifd.get(SUBSEC_TIME_ORIGINAL) or "").strip()
+        if subsec.isdigit():
+            timestamp += float(f"0.{subsec}")
+        return timestamp
+    except Exception:
+        return None
+
+
+def dhash(gray: np.ndarray) -> int:
+    """Hash perceptual de diferencias de 64 bits"""
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int("".join("1" if b else "0" for b in bits), 2)
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def sharpness(gray: np.ndarray) -> float:
+    """Nitidez como varianza del Laplaciano"""
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+def describe_photo(photo: dict) -> dict:
+    """Agregar hora de captura, hash y nitidez a una foto {"key", "contents", ["modified_at"]}"""
+    # Decodificar reducido y en grises alcanza para el hash y la nitidez
+    gray = cv2.imdecode(np.frombuffer(photo["contents"], np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    # Sólo la hora EXIF es hora de captura: la de modificación cambia al copiar los archivos
+    photo["timestamp"] = exif_timestamp(photo["contents"])
+    photo["dhash"] = dhash(gray) if gray is not None else None
+    photo["sharpness"] = sharpness(gray) if gray is not None else 0.0
+    return photo
+
+
+def _similar(a: dict, b: dict, max_distance: int) -> bool:
+    return a["dhash"] is not None and b["dhash"] is not None and hamming(a["dhash"], b["dhash"]) <= max_distance
+
+
+def group_bursts(photos: List[dict], max_gap: float = BURST_MAX_GAP_SECONDS,
+                 max_distance: int = BURST_HASH_DISTANCE) -> List[List[dict]]:
+    """Agrupar fotos consecutivas en el tiempo que parecen la misma escena.
+
+    Las fotos sin hora de captura quedan cada una en su propio grupo; entre ellas
+    sólo se ordenan por "modified_at" si viene.
+    """
+    for photo in photos:
+        if "dhash" not in photo:
+            describe_photo(photo)
+
+    ordered = sorted(photos, key=lambda p: (
+        p["timestamp"] is None,
+        p["timestamp"] if p["timestamp"] is not None else p.get("modified_at") or 0,
+        str(p["key"]),
+    ))
+    groups = []
+    for photo in ordered:
+        if groups and photo["timestamp"] is not None:
+            burst = groups[-1]
+            previous = burst[-1]
+            close_in_time = (
+                previous["timestamp"] is not None
+                and photo["timestamp"] - previous["timestamp"] <= max_gap
+            )
+            if close_in_time and _similar(photo, previous, max_distance) and _similar(photo, burst[0], max_distance):
+                burst.append(photo)
+                continue
+        groups.append([photo])
+    return groups
+
+
+def sharpest(group: List[dict]) -> dict:
+    """Foto más nítida de una ráfaga"""
+    return max(group, key=lambda p: p["sharpness"])
@@ -1,5 +1,7 @@
 # Configuración de entorno para Grow Labs Races
 
+import os
+
 # Base de datos
 DATABASE_URL = "sqlite:///./database/runners.db"
 
@@ -21,6 +23,90 @@ ALLOWED_EXTENSIONS = [".jpg", ".jpeg", ".png", ".bmp", ".tiff"]
 # Configuración de YOLOv8
 MODEL_CONFIDENCE_THRESHOLD = 0.5
 MODEL_IOU_THRESHOLD = 0.45
+DETECTOR_BACKEND = os.getenv("DETECTOR_BACKEND", "yolo")  # "yolo" o "none" (sin detector, arranque rápido)
+MODEL_LOADING_RETRY_AFTER = 5  # Segundos sugeridos a los clientes mientras carga el modelo
 
 # Configuración de OCR
 TESSERACT_CONFIG = "--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789"
+
+# Configuración de persistencia de detecciones
+DETECTION_BATCH_SIZE = 200  # Filas por inserción en lote
+DETECTION_FLUSH_INTERVAL = 1.0  # Segundos máximos antes de volcar un lote
+
+# Configuración de registros por carrera
+DEFAULT_RACE_ID = "default"  # Carrera usada cuando el request no indica una
+RACE_REGISTRY_IDLE_SECONDS = 30 * 60  # Descartar registros sin uso tras 30 minutos
+RACE_REGISTRY_MAX_RACES = 8  # Máximo de carreras en memoria a la vez
+RACE_REGISTRY_CHECK_SECONDS = 5  # Cada cuánto se verifica si otro proceso cambió los corredores de una carrera
+
+# Configuración del planificador adaptativo de OCR
+OCR_EARLY_ACCEPT_CONFIDENCE = 80  # Confianza de Tesseract a partir de la cual se deja de probar
+OCR_SCHEDULER_EXPLORATION = 0.1  # Probabilidad de volver a probar una estrategia podada
+OCR_SCHEDULER_MIN_TRIALS = 30  # Intentos mínimos antes de podar una estrategia
+OCR_SCHEDULER_PRUNE_RATE = 0.02  # Tasa de victoria por debajo de la cual se poda
+OCR_SCHEDULER_SAVE_EVERY = 50  # Recortes entre guardados de estadísticas
+
+# Configuración del modo de memoria acotada
+BOUNDED_MEMORY_MODE = False  # Reutilizar buffers y limitar la memoria de imágenes en proceso
+MEMORY_BUDGET_BYTES = 1536 * 1024 * 1024  # Memoria máxima para imágenes en proceso por worker
+MEMORY_POOL_MAX_SLOT_BYTES = 64 * 1024 * 1024  # Buffers más grandes no se guardan en el pool
+
+# Configuración del control de admisión
+ADMISSION_MAX_CONCURRENCY = 2  # Requests procesándose a la vez por worker (y hilos del pipeline)
+ADMISSION_RESERVED_INTERACTIVE = 1  # Lugares que las subidas masivas no pueden ocupar
+ADMISSION_LATENCY_TARGETS = {  # Espera máxima en cola (segundos) antes de responder 503
+    "interactive": 0.5,
+    "bulk": 10.0,
+    "batch": 60.0,
+}
+ADMISSION_INITIAL_SERVICE_TIME = {  # Tiempo de servicio estimado inicial (segundos)
+    "interactive": 0.05,
+    "bulk": 2.0,
+    "batch": 20.0,
+}
+ADMISSION_EWMA_ALPHA = 0.2  # Peso de cada medición en el promedio móvil del tiempo de servicio
+
+# Configuración del daemon de ingesta de carpetas
+INGEST_WORKERS = 4  # Imágenes procesándose en paralelo
+INGEST_DEBOUNCE_SECONDS = 2.0  # Tiempo sin cambios para considerar un archivo completo
+
+# Configuración del perfilado bajo demanda
+PROFILE_HEADER = "X-Profile"  # Encabezado que activa el perfilado ("1" muestreo de pila, "cprofile")
+PROFILE_SAMPLE_EVERY = 0  # Perfilar 1 de cada N requests (0 = sólo con encabezado)
+PROFILE_SAMPLE_INTERVAL = 0.005  # Segundos entre muestras de la pila
+
+# Configuración de OCR por mosaico
+OCR_BATCH_MODE = "off"  # "mosaic" para leer todos los torsos de una imagen en una sola pasada
+MOSAIC_FALLBACK = True  # Si el mosaico no lee un dorsal, probar el OCR individual del recorte
+MOSAIC_TESSERACT_CONFIG = r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789'
+MOSAIC_CROP_HEIGHT = 200  # Altura de cada recorte normalizado (px)
+MOSAIC_CROP_MAX_WIDTH = 600  # Ancho máximo de cada recorte normalizado (px)
+MOSAIC_SEPARATOR = 40  # Franja blanca entre recortes (px)
+MOSAIC_MAX_CROPS = 24  # Recortes por mosaico
+MOSAIC_BATCH_WINDOW = 0.0  # Segundos que se espera a recortes de otros hilos (útil en ingesta)
+
+# Configuración del reconocedor liviano de dígitos
+OCR_ENGINE = "tesseract"  # "digits" para usar el reconocedor kNN/HOG con Tesseract como respaldo
+DIGIT_MIN_CONFIDENCE = 0.8  # Confianza mínima por dígito para aceptar la lectura sin Tesseract
+DIGIT_KNN_NEIGHBORS = 5  # Vecinos consultados por el clasificador kNN
+DIGIT_DISTANCE_PERCENTILE = 95  # Percentil de distancias entre glifos de entrenamiento que fija el máximo aceptado
+
+# Configuración de exportación
+EXPORT_CHUNK_SIZE = 5000  # Filas leídas del cursor por bloque al exportar
+
+# Configuración del agrupamiento de ráfagas
+BURST_GROUPING = True  # Procesar sólo la foto más nítida de cada ráfaga en lotes e ingesta
+BURST_MAX_GAP_SECONDS = 1.0  # Separación máxima entre fotos consecutivas de una ráfaga
+BURST_HASH_DISTANCE = 10  # Bits distintos de dHash (de 64) tolerados dentro de una ráfaga
+
+# Configuración de vistas previas y miniaturas
+STORE_ORIGINALS = True  # Guardar las fotos subidas con detecciones para poder generar vistas previas
+PHOTO_STORE_MAX_BYTES = 20 * 1024 * 1024 * 1024  # Disco máximo para originales (~3000 fotos de 24 MP); se descartan los menos usados
+PREVIEW_CACHE_MAX_BYTES = 512 * 1024 * 1024  # Tamaño máximo de la caché de vistas previas en disco
+PREVIEW_DEFAULT_WIDTH = 1024  # Ancho por defecto de la foto anotada (px)
+PREVIEW_MAX_WIDTH = 2048  # Ancho máximo pedible de la foto anotada (px)
+THUMBNAIL_DEFAULT_SIZE = 256  # Lado por defecto de la miniatura de un recorte (px)
+THUMBNAIL_MAX_SIZE = 1024  # Lado máximo pedible de una miniatura (px)
+PREVIEW_SIZE_STEP = 64  # Los tamaños se redondean a múltiplos de este paso para acotar variantes
+PREVIEW_JPEG_QUALITY = 85
+PREVIEW_MAX_AGE = 86400  # Segundos de Cache-Control para vistas previas
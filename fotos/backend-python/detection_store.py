@@ -0,0 +1,226 @@
+"""Persistencia de detecciones e índice inverso dorsal -> fotos.
+
+Las detecciones de /detect-plate se guardan en SQLite para poder responder
+"todas las fotos del dorsal 847" sin reprocesar la galería. La escritura se
+hace en lotes desde un hilo en segundo plano para no frenar la detección.
+"""
+import hashlib
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from config import DEFAULT_RACE_ID, DETECTION_BATCH_SIZE, DETECTION_FLUSH_INTERVAL
+
+
+def photo_id_for(contents: bytes) -> str:
+    """Identificador estable de una foto a partir de su contenido"""
+    return hashlib.sha256(contents).hexdigest()
+
+
+def connect(database_path: Path) -> sqlite3.Connection:
+    """Abrir conexión en modo WAL para que lecturas y escrituras no se bloqueen"""
+    conn = sqlite3.connect(database_path, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+def init_detections_table(database_path: Path):
+    """Crear la tabla de detecciones y sus índices"""
+    conn = connect(database_path)
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS detections (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            race_id TEXT NOT NULL DEFAULT 'default',
+            photo_id TEXT NOT NULL,
+            photo_path TEXT,
+            plate_number TEXT NOT NULL,
+            x1 INTEGER,
+            y1 INTEGER,
+            x2 INTEGER,
+            y2 INTEGER,
+            confidence REAL,
+            method TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Tablas creadas antes de particionar por carrera no tienen race_id
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(detections)')]
+    if 'race_id' not in columns:
+        cursor.execute("ALTER TABLE detections ADD COLUMN race_id TEXT NOT NULL DEFAULT 'default'")
+
+    # Índices para buscar por dorsal (dentro de una carrera) y por foto
+    cursor.execute('DROP INDEX IF EXISTS idx_detections_plate')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_detections_race_plate ON detections (race_id, plate_number)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_detections_photo ON detections (photo_id)')
+
+    conn.commit()
+    conn.close()
+
+
+def get_photos_by_plate(database_path: Path, plate_number: str, race_id: str = DEFAULT_RACE_ID) -> List[dict]:
+    """Buscar todas las fotos donde aparece un dorsal en una carrera usando el índice"""
+    conn = connect(database_path)
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT id, photo_id, photo_path, x1, y1, x2, y2, confidence, method, created_at
+        FROM detections
+        WHERE race_id = ? AND plate_number = ?
+        ORDER BY created_at, id
+    ''', (race_id, plate_number))
+    rows = cursor.fetchall()
+
+    conn.close()
+
+    return [
+        {
+            "detection_id": detection_id,
+            "photo_id": photo_id,
+            "photo_path": photo_path,
+            "coordinates": {"x1": x1, "y1": y1, "x2": x2, "y2": y2},
+            "confidence": confidence,
+            "method": method,
+            "detected_at": created_at,
+        }
+        for detection_id, photo_id, photo_path, x1, y1, x2, y2, confidence, method, created_at in rows
+    ]
+
+
+def get_detections_by_photo(database_path: Path, photo_id: str) -> List[dict]:
+    """Detecciones de una foto, en el orden en que se guardaron"""
+    conn = connect(database_path)
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT id, photo_path, plate_number, x1, y1, x2, y2
+        FROM detections
+        WHERE photo_id = ?
+        ORDER BY id
+    ''', (photo_id,))
+    rows = cursor.fetchall()
+
+    conn.close()
+
+    return [
+        {
+            "detection_id": detection_id,
+            "photo_path": photo_path,
+            "plate_number": plate_number,
+            "coordinates": {"x1": x1, "y1": y1, "x2": x2, "y2": y2},
+        }
+        for detection_id, photo_path, plate_number, x1, y1, x2, y2 in rows
+    ]
+
+
+def get_detection(database_path: Path, detection_id: int) -> Optional[dict]:
+    """Una detección por su id"""
+    conn = connect(database_path)
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT photo_id, photo_path, plate_number, x1, y1, x2, y2
+        FROM detections
+        WHERE id = ?
+    ''', (detection_id,))
+    row = cursor.fetchone()
+
+    conn.close()
+
+    if row is None:
+        return None
+    photo_id, photo_path, plate_number, x1, y1, x2, y2 = row
+    return {
+        "detection_id": detection_id,
+        "photo_id": photo_id,
+        "photo_path": photo_path,
+        "plate_number": plate_number,
+        "coordinates": {"x1": x1, "y1": y1, "x2": x2, "y2": y2},
+    }
+
+
+class DetectionWriter:
+    """Escritor en lotes de detecciones.
+
+    Las detecciones se encolan sin tocar la base de datos y un hilo las inserta
+    con executemany cuando se junta un lote o vence el intervalo de volcado.
+    """
+
+    def __init__(self, database_path: Path, batch_size: int = DETECTION_BATCH_SIZE,
+                 flush_interval: float = DETECTION_FLUSH_INTERVAL):
+        self.database_path = database_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Iniciar el hilo de escritura"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="detection-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Volcar lo pendiente y detener el hilo"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def add(self, photo_id: str, photo_path: Optional[str], plates: List[dict],
+            race_id: str = DEFAULT_RACE_ID):
+        """Encolar las placas detectadas en una foto"""
+        for plate in plates:
+            coords = plate["coordinates"]
+            self._queue.put((
+                race_id,
+                photo_id,
+                photo_path,
+                plate["plate_number"],
+                int(coords["x1"]), int(coords["y1"]), int(coords["x2"]), int(coords["y2"]),
+                float(plate["confidence"]),
+                plate["method"],
+            ))
+
+    def _run(self):
+        conn = connect(self.database_path)
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        running = True
+
+        while running:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                if item is None:
+                    running = False
+                else:
+                    batch.append(item)
+            except queue.Empty:
+                pass
+
+            if batch and (not running or len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._write(conn, batch)
+                batch = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+
+        conn.close()
+
+    def _write(self, conn: sqlite3.Connection, batch: List[tuple]):
+        try:
+            conn.executemany('''
+                INSERT INTO detections
+                    (race_id, photo_id, photo_path, plate_number, x1, y1, x2, y2, confidence, method)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', batch)
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"[WARNING] Error guardando {len(batch)} detecciones: {e}")
@@ -0,0 +1,99 @@
+"""Detectores de personas usados para ubicar los dorsales.
+
+El detector YOLO importa torch/ultralytics recién al cargarse, así que importar
+la app no paga ese costo. El detector "none" no usa ningún modelo: la detección
+cae directamente a la búsqueda de placas por regiones.
+"""
+import threading
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+from startup_report import import_timed, timed_phase
+
+
+class YoloDetector:
+    """Detector YOLOv8 que carga el modelo la primera vez que se usa"""
+
+    name = "yolo"
+
+    def __init__(self, model_path: Path):
+        self.model_path = model_path
+        self._model = None
+        self.load_error = None
+        self._load_lock = threading.Lock()
+        # El modelo se comparte entre hilos (daemon de ingesta), una inferencia a la vez
+        self._inference_lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def load(self):
+        """Cargar el modelo (se descargará automáticamente si no existe)"""
+        with self._load_lock:
+            if self._model is not None:
+                return self._model
+
+            try:
+                with timed_phase("load_yolo_model"):
+                    YOLO = import_timed("ultralytics").YOLO
+                    try:
+                        model = YOLO(self.model_path)
+                        print("[OK] Modelo YOLOv8 cargado correctamente")
+                    except Exception as e:
+                        print(f"[WARNING] Error cargando modelo: {e}")
+                        print("[INFO] Descargando modelo YOLOv8...")
+                        model = YOLO('yolov8n.pt')
+                        model.save(self.model_path)
+            except Exception as e:
+                # Queda registrado para /health; un próximo load() vuelve a intentar
+                self.load_error = str(e)
+                print(f"[ERROR] No se pudo cargar el modelo: {e}")
+                raise
+            self.load_error = None
+            self._model = model
+            return model
+
+    def detect(self, image: np.ndarray) -> List[dict]:
+        """Detectar objetos y devolver sus cajas en coordenadas de la imagen"""
+        model = self.load()
+        with self._inference_lock:
+            results = model(image)
+
+        boxes = []
+        for result in results:
+            if result.boxes is None:
+                continue
+            for box in result.boxes:
+                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
+                boxes.append({
+                    "x1": float(x1), "y1": float(y1), "x2": float(x2), "y2": float(y2),
+                    "confidence": float(box.conf[0].cpu().numpy()),
+                    "class_id": int(box.cls[0].cpu().numpy()),
+                })
+        return boxes
+
+
+class NullDetector:
+    """Modo sin detector: no devuelve cajas"""
+
+    name = "none"
+    loaded = True
+    load_error = None
+
+    def load(self):
+        return None
+
+    def detect(self, image: np.ndarray) -> List[dict]:
+        return []
+
+
+def create_detector(backend: str, model_path: Path):
+    """Crear el detector configurado ("yolo" o "none")"""
+    if backend == "none":
+        return NullDetector()
+    if backend == "yolo":
+        return YoloDetector(model_path)
+    raise ValueError(f"Detector desconocido: {backend}")
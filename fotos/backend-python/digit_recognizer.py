@@ -0,0 +1,244 @@
+"""Reconocedor liviano de dígitos para CPU.
+
+Los dorsales tienen 2 a 4 dígitos, así que no hace falta un OCR general. Este
+motor segmenta los caracteres con contornos de OpenCV y clasifica cada uno con
+kNN sobre descriptores HOG, entrenado con dígitos sintéticos renderizados con
+las fuentes de OpenCV. Devuelve la confianza de cada dígito para que el
+llamador recurra a Tesseract cuando la lectura es dudosa.
+
+La confianza combina los votos de los vecinos con la distancia al más cercano:
+un glifo más lejos de los dígitos conocidos que lo que se alejan entre sí los
+glifos de entrenamiento (letras, logos) no es un dígito y anula la lectura.
+Para verificarlo:
+
+    python digit_recognizer.py
+"""
+import sys
+import threading
+from pathlib import Path
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+from config import DIGIT_DISTANCE_PERCENTILE, DIGIT_KNN_NEIGHBORS, DIGIT_MIN_CONFIDENCE
+
+GLYPH_SIZE = 32
+
+FONTS = [
+    cv2.FONT_HERSHEY_SIMPLEX,
+    cv2.FONT_HERSHEY_DUPLEX,
+    cv2.FONT_HERSHEY_COMPLEX,
+    cv2.FONT_HERSHEY_TRIPLEX,
+    cv2.FONT_HERSHEY_PLAIN,
+]
+
+
+def _hog() -> cv2.HOGDescriptor:
+    # Ventana de 32x32, bloques de 16x16 con celdas de 8x8: 324 valores por glifo
+    return cv2.HOGDescriptor((GLYPH_SIZE, GLYPH_SIZE), (16, 16), (8, 8), (8, 8), 9)
+
+
+def normalize_glyph(binary: np.ndarray) -> np.ndarray:
+    """Recortar el carácter (blanco sobre negro), centrarlo en un cuadrado y escalarlo"""
+    points = cv2.findNonZero(binary)
+    if points is None:
+        return np.zeros((GLYPH_SIZE, GLYPH_SIZE), dtype=np.uint8)
+    x, y, w, h = cv2.boundingRect(points)
+    glyph = binary[y:y + h, x:x + w]
+
+    side = int(max(w, h) * 1.2) + 2
+    square = np.zeros((side, side), dtype=np.uint8)
+    square[(side - h) // 2:(side - h) // 2 + h, (side - w) // 2:(side - w) // 2 + w] = glyph
+    return cv2.resize(square, (GLYPH_SIZE, GLYPH_SIZE), interpolation=cv2.INTER_AREA)
+
+
+def render_synthetic_digits():
+    """Generar glifos de entrenamiento variando fuente, grosor y rotación"""
+    glyphs, labels = [], []
+    for digit in range(10):
+        for font in FONTS:
+            for thickness in (2, 3, 4, 6):
+                for angle in (-8, 0, 8):
+                    canvas = np.zeros((96, 96), dtype=np.uint8)
+                    cv2.putText(canvas, str(digit), (20, 76), font, 2.5, 255, thickness, cv2.LINE_AA)
+                    rotation = cv2.getRotationMatrix2D((48, 48), angle, 1.0)
+                    canvas = cv2.warpAffine(canvas, rotation, (96, 96))
+                    _, canvas = cv2.threshold(canvas, 127, 255, cv2.THRESH_BINARY)
+                    glyphs.append(normalize_glyph(canvas))
+                    labels.append(digit)
+    return glyphs, np.array(labels, dtype=np.int32)
+
+
+class DigitRecognizer:
+    """Segmentación por contornos y clasificación kNN/HOG de dígitos"""
+
+    def __init__(self, model_path: Path, neighbors: int = DIGIT_KNN_NEIGHBORS):
+        self.model_path = model_path
+        self.neighbors = neighbors
+        self._hog = _hog()
+        self._knn = None
+        self.max_distance = None
+        self._lock = threading.Lock()
+
+    def _features(self, glyphs: List[np.ndarray]) -> np.ndarray:
+        return np.array([self._hog.compute(g).ravel() for g in glyphs], dtype=np.float32)
+
+    def _load(self):
+        """Entrenar (o cargar lo ya entrenado) la primera vez que se usa"""
+        with self._lock:
+            if self._knn is not None:
+                return self._knn
+
+            if self.model_path.exists():
+                data = np.load(self.model_path)
+                features, labels = data["features"], data["labels"]
+            else:
+                glyphs, labels = render_synthetic_digits()
+                features = self._features(glyphs)
+                self.model_path.parent.mkdir(parents=True, exist_ok=True)
+                np.savez_compressed(self.model_path, features=features, labels=labels)
+                print(f"[OK] Reconocedor de dígitos entrenado con {len(labels)} glifos sintéticos")
+
+            knn = cv2.ml.KNearest_create()
+            knn.train(features, cv2.ml.ROW_SAMPLE, labels.reshape(-1, 1))
+
+            # Calibrar la distancia máxima aceptada: distancia de cada glifo de entrenamiento
+            # a su vecino más cercano (el primero es él mismo)
+            _, _, _, distances = knn.findNearest(features, 2)
+            self.max_distance = float(np.percentile(distances[:, 1], DIGIT_DISTANCE_PERCENTILE))
+            self._knn = knn
+            return knn
+
+    def _confidence(self, votes: float, distance: float) -> float:
+        # Glifos más lejos que el máximo calibrado no son dígitos
+        if distance > self.max_distance:
+            return 0.0
+        return votes * (1 - (distance / self.max_distance) ** 2)
+
+    def _candidate_boxes(self, binary: np.ndarray):
+        # Contornos con forma de carácter: más altos que anchos y de tamaño razonable.
+        # Los dígitos quedan dentro del agujero que el dorsal deja en la camiseta, así que
+        # se toman los bordes exteriores de todos los componentes a cualquier profundidad
+        # (RETR_CCOMP pone en el primer nivel todo lo que no es un agujero)
+        contours, hierarchy = cv2.findContours(binary, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+        if hierarchy is None:
+            return []
+        height = binary.shape[0]
+        boxes = []
+        for contour, (_, _, _, parent) in zip(contours, hierarchy[0]):
+            if parent != -1:
+                continue
+            x, y, w, h = cv2.boundingRect(contour)
+            if h < max(8, height * 0.05) or h > height * 0.9:
+                continue
+            if not 0.15 <= w / h <= 1.0:
+                continue
+            boxes.append((x, y, w, h))
+        return boxes
+
+    @staticmethod
+    def _digit_rows(boxes):
+        # Grupos de 2 a 4 cajas de altura parecida, alineadas y cercanas en horizontal
+        rows = []
+        for ax, ay, aw, ah in boxes:
+            center = ay + ah / 2
+            aligned = sorted(
+                b for b in boxes
+                if abs(b[3] - ah) <= 0.25 * ah and abs(b[1] + b[3] / 2 - center) <= 0.5 * ah
+            )
+            run = [aligned[0]]
+            for box in aligned[1:]:
+                previous = run[-1]
+                if box[0] - (previous[0] + previous[2]) <= ah:
+                    run.append(box)
+                else:
+                    if 2 <= len(run) <= 4:
+                        rows.append(tuple(run))
+                    run = [box]
+            if 2 <= len(run) <= 4:
+                rows.append(tuple(run))
+        return set(rows)
+
+    def read(self, image: np.ndarray) -> Optional[dict]:
+        """Leer el número del dorsal; devuelve texto, confianza mínima y detalle por dígito"""
+        knn = self._load()
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+        best = None
+        # Dígitos oscuros sobre fondo claro (lo habitual) y al revés
+        for candidate, ink in ((cv2.bitwise_not(binary), cv2.THRESH_BINARY_INV), (binary, cv2.THRESH_BINARY)):
+            for row in self._digit_rows(self._candidate_boxes(candidate)):
+                # El umbral global se desplaza con el color de la camiseta y engorda o adelgaza
+                # los trazos; cada glifo se vuelve a umbralizar sólo entre tinta y dorsal
+                glyphs = [
+                    normalize_glyph(cv2.threshold(gray[y:y + h, x:x + w], 0, 255, ink + cv2.THRESH_OTSU)[1])
+                    for x, y, w, h in row
+                ]
+                _, results, neighbours, distances = knn.findNearest(self._features(glyphs), self.neighbors)
+
+                digits = []
+                for (x, y, w, h), label, votes, distance in zip(row, results.ravel(), neighbours, distances):
+                    digits.append({
+                        "digit": str(int(label)),
+                        "confidence": self._confidence(float(np.mean(votes == label)), float(distance[0])),
+                        "box": {"x1": int(x), "y1": int(y), "x2": int(x + w), "y2": int(y + h)},
+                    })
+
+                confidence = min(d["confidence"] for d in digits)
+                if best is None or confidence > best["confidence"]:
+                    best = {
+                        "text": "".join(d["digit"] for d in digits),
+                        "confidence": confidence,
+                        "digits": digits,
+                    }
+        return best
+
+
+def _render_text(text: str, font: int) -> np.ndarray:
+    """Texto oscuro sobre fondo claro, como un dorsal recortado"""
+    image = np.full((200, 120 * len(text) + 80, 3), 235, dtype=np.uint8)
+    cv2.putText(image, text, (30, 150), font, 3, (20, 20, 20), 8, cv2.LINE_AA)
+    return cv2.GaussianBlur(image, (3, 3), 0)
+
+
+def _render_torso(text: str, font: int, shirt) -> np.ndarray:
+    """Recorte de torso como los que pasa detect_plates: camiseta de color con el dorsal blanco"""
+    image = np.full((700, 520, 3), (120, 160, 90), dtype=np.uint8)
+    cv2.rectangle(image, (40, 40), (480, 700), shirt, cv2.FILLED)
+    width = 100 * len(text) + 40
+    cv2.rectangle(image, (260 - width // 2, 220), (260 + width // 2, 420), (240, 240, 240), cv2.FILLED)
+    cv2.putText(image, text, (260 - width // 2 + 25, 365), font, 3, (20, 20, 20), 8, cv2.LINE_AA)
+    return cv2.GaussianBlur(image, (3, 3), 0)
+
+
+def self_check(recognizer: DigitRecognizer) -> bool:
+    """Los dorsales deben leerse, solos o sobre un torso, y el texto que no es numérico debe caer a Tesseract"""
+    ok = True
+    fonts = [cv2.FONT_HERSHEY_SIMPLEX, cv2.FONT_HERSHEY_DUPLEX, cv2.FONT_HERSHEY_TRIPLEX]
+    shirts = [(200, 40, 40), (30, 30, 30), (40, 40, 200), (230, 230, 230), (0, 200, 255)]
+    digit_images = [(text, _render_text(text, font)) for text in ["847", "123", "2056", "90"] for font in fonts]
+    digit_images += [(text, _render_torso(text, font, shirt))
+                     for text in ["847", "2056"] for font in fonts for shirt in shirts]
+    for text, image in digit_images:
+        reading = recognizer.read(image)
+        if not reading or reading["text"] != text or reading["confidence"] < DIGIT_MIN_CONFIDENCE:
+            print(f"[FAIL] {text!r} leído como {reading}")
+            ok = False
+
+    word_images = [(text, _render_text(text, font)) for text in ["ABC", "RUN", "adidas", "NIKE", "ZONA"] for font in fonts]
+    word_images += [(text, _render_torso(text, font, shirt))
+                    for text in ["RUN", "NIKE"] for font in fonts for shirt in shirts]
+    for text, image in word_images:
+        reading = recognizer.read(image)
+        if reading and reading["confidence"] >= DIGIT_MIN_CONFIDENCE:
+            print(f"[FAIL] {text!r} aceptado como dorsal {reading['text']!r} ({reading['confidence']:.2f})")
+            ok = False
+    print(f"[{'OK' if ok else 'FAIL'}] Distancia máxima calibrada: {recognizer.max_distance:.3f}")
+    return ok
+
+
+if __name__ == "__main__":
+    model_path = Path(__file__).parent.parent / "models" / "digits_knn.npz"
+    sys.exit(0 if self_check(DigitRecognizer(model_path)) else 1)
@@ -0,0 +1,216 @@
+"""Exportación masiva de detecciones para sistemas de cronometraje.
+
+Genera las detecciones unidas con el nombre del corredor en CSV, NDJSON o
+Parquet, leyendo la base de datos por bloques desde un cursor y emitiendo cada
+bloque a medida que se lee, así que exportar millones de filas usa memoria
+constante. Se usa desde GET /export y también como script:
+
+    python export.py --format csv --race-id maraton-2025 --min-confidence 0.5 > detecciones.csv
+"""
+import argparse
+import csv
+import io
+import json
+import sqlite3
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator, Optional
+
+from config import EXPORT_CHUNK_SIZE
+from detection_store import init_detections_table
+from race_registry import init_race_tables
+
+COLUMNS = [
+    "race_id", "photo_id", "photo_path", "plate_number", "runner_name",
+    "x1", "y1", "x2", "y2", "confidence", "method", "detected_at",
+]
+
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def _normalize_time(value: Optional[str]) -> Optional[str]:
+    """Llevar una fecha ISO 8601 al formato de created_at: 'YYYY-MM-DD HH:MM:SS' en UTC.
+
+    Las fechas con zona (Z, -03:00) se convierten a UTC; las que no la tienen se
+    toman como UTC, igual que CURRENT_TIMESTAMP de SQLite.
+    """
+    if not value:
+        return None
+    try:
+        moment = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"Fecha inválida: {value!r} (se espera ISO 8601, p. ej. 2025-10-12T08:00:00-03:00)")
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def iter_rows(database_path: Path, race_id: Optional[str] = None, since: Optional[str] = None,
+              until: Optional[str] = None, min_confidence: Optional[float] = None,
+              chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[list]:
+    """Leer las detecciones filtradas en bloques de filas (since/until ya normalizados)"""
+    conditions, params = [], []
+    if race_id is not None:
+        conditions.append("d.race_id = ?")
+        params.append(race_id)
+    if since is not None:
+        conditions.append("d.created_at >= ?")
+        params.append(since)
+    if until is not None:
+        conditions.append("d.created_at < ?")
+        params.append(until)
+    if min_confidence is not None:
+        conditions.append("d.confidence >= ?")
+        params.append(min_confidence)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    # El generador puede avanzar desde distintos hilos del threadpool de Starlette
+    conn = sqlite3.connect(database_path, check_same_thread=False)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT d.race_id, d.photo_id, d.photo_path, d.plate_number, r.runner_name,
+                   d.x1, d.y1, d.x2, d.y2, d.confidence, d.method, d.created_at
+            FROM detections d
+            LEFT JOIN race_runners r ON r.race_id = d.race_id AND r.plate_number = d.plate_number
+            {where}
+            ORDER BY d.id
+        ''', params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        conn.close()
+
+
+def _iter_csv(chunks: Iterator[list]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def _iter_ndjson(chunks: Iterator[list]) -> Iterator[bytes]:
+    for rows in chunks:
+        yield "".join(
+            json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + "\n" for row in rows
+        ).encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """Archivo en el que escribe Parquet; lo escrito se entrega por bloques"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _iter_parquet(chunks: Iterator[list]) -> Iterator[bytes]:
+    # pyarrow es opcional: sólo hace falta para exportar en Parquet
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("race_id", pa.string()), ("photo_id", pa.string()), ("photo_path", pa.string()),
+        ("plate_number", pa.string()), ("runner_name", pa.string()),
+        ("x1", pa.int32()), ("y1", pa.int32()), ("x2", pa.int32()), ("y2", pa.int32()),
+        ("confidence", pa.float64()), ("method", pa.string()), ("detected_at", pa.string()),
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    # Cada bloque de filas se escribe como un row group
+    for rows in chunks:
+        columns = list(zip(*rows))
+        writer.write_table(pa.Table.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema
+        ))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def iter_export(database_path: Path, fmt: str, **filters) -> Iterator[bytes]:
+    """Exportar las detecciones en el formato pedido, por bloques de bytes"""
+    if fmt not in CONTENT_TYPES:
+        raise ValueError(f"Formato desconocido: {fmt}")
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ValueError("Exportar en Parquet requiere instalar pyarrow")
+
+    # Validar las fechas antes de empezar a responder: iter_rows es un generador
+    filters["since"] = _normalize_time(filters.get("since"))
+    filters["until"] = _normalize_time(filters.get("until"))
+    chunks = iter_rows(database_path, **filters)
+    if fmt == "csv":
+        return _iter_csv(chunks)
+    if fmt == "ndjson":
+        return _iter_ndjson(chunks)
+    return _iter_parquet(chunks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exportar detecciones y corredores")
+    parser.add_argument("--database", type=Path,
+                        default=Path(__file__).parent.parent / "database" / "runners.db")
+    parser.add_argument("--format", choices=sorted(CONTENT_TYPES), default="csv")
+    parser.add_argument("--race-id", default=None)
+    parser.add_argument("--since", default=None,
+                        help="Desde (inclusive), ISO 8601; sin zona se toma como UTC, p. ej. 2025-10-12T08:00:00-03:00")
+    parser.add_argument("--until", default=None, help="Hasta (exclusive), mismo formato que --since")
+    parser.add_argument("--min-confidence", type=float, default=None)
+    parser.add_argument("--output", type=Path, default=None, help="Archivo de salida (por defecto stdout)")
+    args = parser.parse_args()
+
+    # Una base recién creada todavía no tiene las tablas: exportar vacío en vez de fallar
+    args.database.parent.mkdir(parents=True, exist_ok=True)
+    init_detections_table(args.database)
+    init_race_tables(args.database)
+
+    try:
+        chunks = iter_export(args.database, args.format, race_id=args.race_id, since=args.since,
+                             until=args.until, min_confidence=args.min_confidence)
+    except ValueError as e:
+        parser.error(str(e))
+
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
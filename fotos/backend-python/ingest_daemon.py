@@ -0,0 +1,263 @@
+"""Daemon de ingesta de carpetas vigiladas.
+
+Los fotógrafos descargan las tarjetas de memoria en una carpeta compartida
+durante la carrera. Este daemon vigila esas carpetas (inotify en Linux, vía
+watchdog), espera a que cada archivo termine de escribirse y lo pasa por el
+mismo pipeline de detección que /detect-plate usando un pool de workers. Los
+archivos procesados se registran por hash de contenido para no reprocesarlos
+y las detecciones se guardan en la base de datos. Las ráfagas de fotos casi
+idénticas se procesan una sola vez (ver burst_grouping).
+
+Uso:
+    python ingest_daemon.py /ruta/a/fotos [/otra/ruta ...] --race-id maraton-2025
+"""
+import argparse
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+from burst_grouping import group_bursts, sharpest
+from config import ALLOWED_EXTENSIONS, BURST_GROUPING, DEFAULT_RACE_ID, INGEST_DEBOUNCE_SECONDS, INGEST_WORKERS
+
+
+def init_ingest_table(database_path: Path):
+    """Crear la tabla de archivos ingeridos"""
+    conn = sqlite3.connect(database_path)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ingested_files (
+            content_hash TEXT PRIMARY KEY,
+            race_id TEXT NOT NULL,
+            path TEXT NOT NULL,
+            plates_found INTEGER NOT NULL,
+            processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+    conn.close()
+
+
+class _PendingFiles(FileSystemEventHandler):
+    """Registra los archivos que cambian para procesarlos cuando se estabilizan"""
+
+    def __init__(self, daemon: "IngestDaemon"):
+        self.daemon = daemon
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.daemon.touch(Path(event.src_path))
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.daemon.touch(Path(event.src_path))
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.daemon.touch(Path(event.dest_path))
+
+
+class IngestDaemon:
+    """Vigila carpetas y procesa las imágenes nuevas con el pipeline de detección"""
+
+    def __init__(self, directories: List[Path], race_id: str = DEFAULT_RACE_ID,
+                 workers: int = INGEST_WORKERS, debounce_seconds: float = INGEST_DEBOUNCE_SECONDS,
+                 camera_id: Optional[str] = None, mosaic_window: Optional[float] = None):
+        # Importar la app carga el modelo YOLO y la base de datos
+        import main
+        self.app = main
+        self.database_path = main.DATABASE_PATH
+        # Con OCR por mosaico, juntar recortes de varios workers en una misma pasada
+        if mosaic_window is not None:
+            main.mosaic_batcher.window = mosaic_window
+        self.directories = directories
+        self.race_id = race_id
+        self.camera_id = camera_id
+        self.debounce_seconds = debounce_seconds
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest")
+        self.observer = Observer()
+        # ruta -> (último evento, tamaño observado)
+        self._pending: Dict[Path, Tuple[float, int]] = {}
+        self._in_progress = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def touch(self, path: Path):
+        """Marcar un archivo como modificado; se procesa tras el período de espera"""
+        if path.suffix.lower() not in ALLOWED_EXTENSIONS:
+            return
+        with self._lock:
+            self._pending[path] = (time.monotonic(), -1)
+
+    def _ready_files(self) -> List[Path]:
+        # Un archivo está listo si no hubo eventos en el período de espera y su tamaño no cambió
+        now = time.monotonic()
+        ready = []
+        with self._lock:
+            for path, (last_event, last_size) in list(self._pending.items()):
+                if now - last_event < self.debounce_seconds or path in self._in_progress:
+                    continue
+                try:
+                    size = path.stat().st_size
+                except FileNotFoundError:
+                    del self._pending[path]
+                    continue
+                if size == last_size and size > 0:
+                    del self._pending[path]
+                    self._in_progress.add(path)
+                    ready.append(path)
+                else:
+                    self._pending[path] = (now, size)
+        return ready
+
+    def _already_processed(self, content_hash: str) -> bool:
+        conn = sqlite3.connect(self.database_path)
+        cursor = conn.cursor()
+        cursor.execute('SELECT 1 FROM ingested_files WHERE content_hash = ?', (content_hash,))
+        found = cursor.fetchone() is not None
+        conn.close()
+        return found
+
+    def _mark_processed(self, content_hash: str, path: Path, plates_found: int):
+        conn = sqlite3.connect(self.database_path, timeout=30)
+        conn.execute(
+            'INSERT OR IGNORE INTO ingested_files (content_hash, race_id, path, plates_found) VALUES (?, ?, ?, ?)',
+            (content_hash, self.race_id, str(path), plates_found)
+        )
+        conn.commit()
+        conn.close()
+
+    def _release(self, paths: List[Path]):
+        with self._lock:
+            for path in paths:
+                self._in_progress.discard(path)
+
+    def process_batch(self, paths: List[Path]):
+        """Leer un lote de archivos listos, descartar los ya procesados y agrupar las ráfagas"""
+        photos = []
+        for path in paths:
+            try:
+                contents = path.read_bytes()
+                content_hash = self.app.photo_id_for(contents)
+                if self._already_processed(content_hash):
+                    self._release([path])
+                    continue
+                photos.append({
+                    "key": path, "contents": contents, "hash": content_hash,
+                    # Sólo para ordenar: sin EXIF la foto no se agrupa
+                    "modified_at": path.stat().st_mtime,
+                })
+            except Exception as e:
+                print(f"[WARNING] Error leyendo {path}: {e}")
+                self._release([path])
+
+        if BURST_GROUPING and len(photos) > 1:
+            groups = group_bursts(photos)
+        else:
+            groups = [[photo] for photo in photos]
+
+        for group in groups:
+            try:
+                self.executor.submit(self.process_burst, group)
+            except RuntimeError:
+                # El executor ya se está cerrando: procesar en este mismo worker
+                self.process_burst(group)
+
+    def process_burst(self, group: List[dict]):
+        """Detectar placas en la foto más nítida de una ráfaga y propagarlas al resto"""
+        paths = [photo["key"] for photo in group]
+        try:
+            representative = sharpest(group) if len(group) > 1 else group[0]
+            path = representative["key"]
+            image = cv2.imdecode(np.frombuffer(representative["contents"], np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                print(f"[WARNING] No se pudo leer la imagen {path}")
+                return
+
+            ocr_context = f"{self.race_id}:{self.camera_id}" if self.camera_id else self.race_id
+            plates = self.app.detect_plates(image, self.race_id, ocr_context)
+
+            for photo in group:
+                photo_plates = plates
+                if photo is not representative:
+                    photo_plates = [dict(plate, method="burst_propagated") for plate in plates]
+                if photo_plates:
+                    self.app.detection_writer.add(photo["hash"], str(photo["key"]), photo_plates, self.race_id)
+                self._mark_processed(photo["hash"], photo["key"], len(photo_plates))
+
+            burst = f" (ráfaga de {len(group)})" if len(group) > 1 else ""
+            print(f"[OK] {path.name}{burst}: {len(plates)} placa(s)")
+        except Exception as e:
+            print(f"[WARNING] Error procesando {', '.join(p.name for p in paths)}: {e}")
+        finally:
+            self._release(paths)
+
+    def _initial_scan(self):
+        # Archivos que llegaron mientras el daemon no estaba corriendo
+        for directory in self.directories:
+            for path in directory.rglob("*"):
+                if path.is_file():
+                    self.touch(path)
+
+    def run(self):
+        """Iniciar la vigilancia y procesar archivos hasta que se detenga"""
+        app = self.app
+        app.init_database()
+        app.init_race_tables(self.database_path)
+        app.init_detections_table(self.database_path)
+        app.ocr_scheduler.init_table()
+        init_ingest_table(self.database_path)
+        app.detection_writer.start()
+
+        handler = _PendingFiles(self)
+        for directory in self.directories:
+            self.observer.schedule(handler, str(directory), recursive=True)
+        self.observer.start()
+        self._initial_scan()
+        print(f"[OK] Vigilando {', '.join(str(d) for d in self.directories)} (carrera {self.race_id})")
+
+        try:
+            while not self._stop.is_set():
+                ready = self._ready_files()
+                if ready:
+                    self.executor.submit(self.process_batch, ready)
+                self._stop.wait(min(1.0, self.debounce_seconds / 2))
+        finally:
+            self.observer.stop()
+            self.observer.join()
+            self.executor.shutdown(wait=True)
+            app.detection_writer.stop()
+            app.ocr_scheduler.save()
+
+    def stop(self):
+        self._stop.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingesta de fotos desde carpetas vigiladas")
+    parser.add_argument("directories", nargs="+", type=Path, help="Carpetas a vigilar")
+    parser.add_argument("--race-id", default=DEFAULT_RACE_ID, help="Carrera a la que pertenecen las fotos")
+    parser.add_argument("--camera-id", default=None, help="Cámara o fotógrafo, para el planificador de OCR")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="Workers de detección")
+    parser.add_argument("--debounce", type=float, default=INGEST_DEBOUNCE_SECONDS,
+                        help="Segundos sin cambios antes de procesar un archivo")
+    parser.add_argument("--mosaic-window", type=float, default=None,
+                        help="Segundos para juntar recortes de varios workers en un mosaico (OCR_BATCH_MODE=mosaic)")
+    args = parser.parse_args()
+
+    daemon = IngestDaemon(args.directories, args.race_id, args.workers, args.debounce, args.camera_id,
+                          args.mosaic_window)
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        print("[INFO] Deteniendo ingesta...")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""Generador de carga HTTP para planificar capacidad antes del día de la carrera.
+
+Reproduce una carpeta de fotos contra /detect-plate (y consultas a /runners)
+con una concurrencia fija o una tasa de llegada, contra un servidor local que
+puede iniciar el propio script. Reporta throughput, latencias p50/p95/p99,
+tasas de error, 404 y 503, y el CPU/RSS del servidor a lo largo del tiempo.
+
+Uso:
+    python loadtest.py fotos/ --start-server --concurrency 8 --duration 60
+    python loadtest.py fotos/ --url http://localhost:8000 --rate 5 --runners-ratio 0.2
+"""
+import argparse
+import itertools
+import json
+import math
+import mimetypes
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+
+import requests
+
+from config import ALLOWED_EXTENSIONS, DEFAULT_RACE_ID
+
+# Demora entre la llegada programada y el envío a partir de la cual una llegada cuenta como atrasada
+LATE_ARRIVAL_TOLERANCE = 0.01
+
+
+def load_corpus(directory: Path) -> List[Path]:
+    """Fotos de la carpeta a reproducir"""
+    photos = sorted(p for p in directory.rglob("*") if p.suffix.lower() in ALLOWED_EXTENSIONS)
+    if not photos:
+        raise SystemExit(f"No hay fotos en {directory}")
+    return photos
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """Percentil por rango más cercano"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class ServerMonitor:
+    """Muestrea CPU y RSS de un proceso desde /proc (Linux)"""
+
+    def __init__(self, pid: int, interval: float = 1.0):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="server-monitor", daemon=True)
+        self._ticks = os.sysconf("SC_CLK_TCK")
+
+    def _read(self):
+        with open(f"/proc/{self.pid}/stat") as f:
+            # El nombre del proceso puede tener espacios: separar después del ")"
+            fields = f.read().rsplit(")", 1)[1].split()
+        cpu_seconds = (int(fields[11]) + int(fields[12])) / self._ticks
+        rss_bytes = 0
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss_bytes = int(line.split()[1]) * 1024
+        return cpu_seconds, rss_bytes
+
+    def _run(self):
+        start = time.monotonic()
+        last_time, (last_cpu, _) = start, self._read()
+        while not self._stop.wait(self.interval):
+            try:
+                cpu, rss = self._read()
+            except (FileNotFoundError, ProcessLookupError):
+                return
+            now = time.monotonic()
+            self.samples.append({
+                "t": round(now - start, 1),
+                "cpu_percent": round(100 * (cpu - last_cpu) / (now - last_time), 1),
+                "rss_mb": round(rss / 1024 / 1024, 1),
+            })
+            last_time, last_cpu = now, cpu
+
+    def start(self):
+        if os.path.exists(f"/proc/{self.pid}/stat"):
+            self._thread.start()
+        else:
+            print("[WARNING] /proc no disponible, no se mide CPU/RSS del servidor")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+
+def start_server(port: int) -> subprocess.Popen:
+    """Iniciar la API localmente y esperar a que /ready confirme el modelo cargado"""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=Path(__file__).parent,
+    )
+    url = f"http://127.0.0.1:{port}/ready"
+    deadline = time.monotonic() + 300
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit("El servidor terminó antes de estar listo")
+        try:
+            if requests.get(url, timeout=1).ok:
+                return process
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise SystemExit("El servidor no respondió a tiempo")
+
+
+class LoadTest:
+    """Envía requests y acumula resultados"""
+
+    def __init__(self, base_url: str, photos: List[Path], race_id: str, runners_ratio: float, timeout: float):
+        self.base_url = base_url.rstrip("/")
+        self.photos = itertools.cycle(photos)
+        self.race_id = race_id
+        self.runners_ratio = runners_ratio
+        self.timeout = timeout
+        # (tipo, status, latencia, perf_counter al terminar)
+        self.results = []
+        self.arrivals = None
+        self.window_end = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            self._local.session = session
+        return session
+
+    def send_one(self, scheduled: Optional[float] = None):
+        """Enviar un request (subida de foto o consulta de corredores).
+
+        Con scheduled (perf_counter de la llegada programada) la latencia se mide desde
+        la llegada, incluyendo la espera por un worker libre.
+        """
+        session = self._session()
+        if random.random() < self.runners_ratio:
+            kind = "runners"
+            call = lambda: session.get(f"{self.base_url}/runners", params={"race_id": self.race_id}, timeout=self.timeout)
+        else:
+            kind = "detect"
+            with self._lock:
+                photo = next(self.photos)
+            data = photo.read_bytes()
+            call = lambda: session.post(
+                f"{self.base_url}/detect-plate",
+                files={"file": (photo.name, data, mimetypes.guess_type(photo.name)[0] or "image/jpeg")},
+                data={"race_id": self.race_id},
+                timeout=self.timeout,
+            )
+
+        start = time.perf_counter()
+        origin = scheduled if scheduled is not None else start
+        try:
+            status = call().status_code
+        except requests.RequestException:
+            status = None
+        finished = time.perf_counter()
+        latency = finished - origin
+
+        with self._lock:
+            self.results.append((kind, status, latency, finished))
+            if scheduled is not None and start - scheduled > LATE_ARRIVAL_TOLERANCE:
+                self.arrivals["late"] += 1
+
+    def run_concurrency(self, concurrency: int, duration: float) -> float:
+        """Lazo cerrado: cada worker envía el siguiente request al terminar el anterior.
+
+        Devuelve la duración de la prueba, sin contar la espera de los últimos requests.
+        """
+        start = time.perf_counter()
+        deadline = start + duration
+
+        def worker():
+            while time.perf_counter() < deadline:
+                self.send_one()
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.window_end = deadline
+        return min(duration, time.perf_counter() - start)
+
+    def run_rate(self, rate: float, duration: float, max_in_flight: int) -> float:
+        """Lazo abierto: llegadas de Poisson a la tasa indicada, sin esperar respuestas.
+
+        La latencia se mide desde la llegada programada, así que la espera por un
+        worker cuando hay max_in_flight requests abiertos también cuenta. Las
+        llegadas que siguen en cola al cerrar la ventana se envían igual y entran
+        en los percentiles con toda su espera. Devuelve la duración de la ventana
+        de llegadas.
+        """
+        self.arrivals = {"scheduled": 0, "late": 0, "after_window": 0}
+        executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        futures = []
+        start = time.perf_counter()
+        deadline = start + duration
+        next_arrival = start
+        while next_arrival < deadline:
+            time.sleep(max(0.0, next_arrival - time.perf_counter()))
+            executor.submit(self.send_one, next_arrival)
+            self.arrivals["scheduled"] += 1
+            next_arrival += random.expovariate(rate)
+        self.window_end = time.perf_counter()
+
+        # Esperar a que terminen todas las llegadas, incluidas las que siguen en cola
+        executor.shutdown(wait=True)
+        self.arrivals["after_window"] = sum(1 for r in self.results if r[3] > self.window_end)
+        return self.window_end - start
+
+    def report(self, elapsed: float, server_samples: list) -> dict:
+        summary = {"elapsed_seconds": round(elapsed, 1), "by_kind": {}}
+        for kind in ("detect", "runners"):
+            rows = [r for r in self.results if r[0] == kind]
+            if not rows:
+                continue
+            total = len(rows)
+            ok_latencies = [lat for _, status, lat, _ in rows if status in (200, 404)]
+            count = lambda pred: sum(1 for _, status, _, _ in rows if pred(status))
+            # Throughput: lo completado dentro de la ventana; lo que terminó después sólo cuenta en latencias
+            completed = sum(1 for *_, finished in rows if finished <= self.window_end)
+            summary["by_kind"][kind] = {
+                "requests": total,
+                "throughput_rps": round(completed / elapsed, 2),
+                "p50_ms": _ms(percentile(ok_latencies, 50)),
+                "p95_ms": _ms(percentile(ok_latencies, 95)),
+                "p99_ms": _ms(percentile(ok_latencies, 99)),
+                "not_found_rate": round(count(lambda s: s == 404) / total, 3),
+                "shed_rate": round(count(lambda s: s == 503) / total, 3),
+                "error_rate": round(count(lambda s: s is None or (s >= 400 and s not in (404, 503))) / total, 3),
+            }
+        if self.arrivals is not None:
+            summary["arrivals"] = dict(self.arrivals)
+        summary["server"] = server_samples
+        return summary
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def print_report(summary: dict):
+    print(f"\nDuración: {summary['elapsed_seconds']}s")
+    print(f"{'tipo':<8} {'reqs':>6} {'rps':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'404':>6} {'503':>6} {'error':>6}")
+    for kind, s in summary["by_kind"].items():
+        print(f"{kind:<8} {s['requests']:>6} {s['throughput_rps']:>7} {s['p50_ms'] or '-':>8} "
+              f"{s['p95_ms'] or '-':>8} {s['p99_ms'] or '-':>8} {s['not_found_rate']:>6} "
+              f"{s['shed_rate']:>6} {s['error_rate']:>6}")
+    if "arrivals" in summary:
+        a = summary["arrivals"]
+        print(f"Llegadas: {a['scheduled']} programadas, {a['late']} atrasadas por falta de worker, "
+              f"{a['after_window']} terminadas después de la ventana")
+    if summary["server"]:
+        peak_rss = max(s["rss_mb"] for s in summary["server"])
+        avg_cpu = sum(s["cpu_percent"] for s in summary["server"]) / len(summary["server"])
+        print(f"Servidor: CPU promedio {avg_cpu:.0f}%, RSS máximo {peak_rss:.0f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de la API de detección")
+    parser.add_argument("photos", type=Path, help="Carpeta con las fotos a reproducir")
+    parser.add_argument("--url", default=None, help="URL de un servidor ya iniciado")
+    parser.add_argument("--start-server", action="store_true", help="Iniciar la API localmente")
+    parser.add_argument("--port", type=int, default=8010, help="Puerto para el servidor iniciado")
+    parser.add_argument("--server-pid", type=int, default=None, help="PID del servidor para medir CPU/RSS")
+    parser.add_argument("--concurrency", type=int, default=4, help="Requests simultáneos (lazo cerrado)")
+    parser.add_argument("--rate", type=float, default=None, help="Requests por segundo (lazo abierto)")
+    parser.add_argument("--max-in-flight", type=int, default=64, help="Límite de requests abiertos con --rate")
+    parser.add_argument("--duration", type=float, default=30, help="Segundos de prueba")
+    parser.add_argument("--runners-ratio", type=float, default=0.0, help="Fracción de requests a /runners")
+    parser.add_argument("--race-id", default=DEFAULT_RACE_ID)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--output", type=Path, default=None, help="Guardar el reporte en JSON")
+    args = parser.parse_args()
+
+    photos = load_corpus(args.photos)
+    server = None
+    pid = args.server_pid
+    if args.start_server:
+        server = start_server(args.port)
+        base_url = f"http://127.0.0.1:{args.port}"
+        pid = server.pid
+    elif args.url:
+        base_url = args.url
+    else:
+        parser.error("Indicar --url o --start-server")
+
+    monitor = ServerMonitor(pid) if pid else None
+    if monitor:
+        monitor.start()
+
+    test = LoadTest(base_url, photos, args.race_id, args.runners_ratio, args.timeout)
+    print(f"[INFO] {len(photos)} fotos contra {base_url} durante {args.duration:.0f}s")
+    try:
+        if args.rate:
+            elapsed = test.run_rate(args.rate, args.duration, args.max_in_flight)
+        else:
+            elapsed = test.run_concurrency(args.concurrency, args.duration)
+    finally:
+        if monitor:
+            monitor.stop()
+        if server:
+            server.terminate()
+            server.wait()
+
+    summary = test.report(elapsed, monitor.samples if monitor else [])
+    print_report(summary)
+    if args.output:
+        args.output.write_text(json.dumps(summary, indent=2))
+        print(f"[OK] Reporte guardado en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,51 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+# Primero, para medir el arranque desde el inicio
+from startup_report import import_timed, report as startup_report, timed_phase
+from fastapi import FastAPI, File, Form, Request, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel
 import uvicorn
 import os
 from pathlib import Path
-import cv2
-import numpy as np
-from PIL import Image
-import pytesseract
-from ultralytics import YOLO
+cv2 = import_timed("cv2")
+np = import_timed("numpy")
+import asyncio
+import functools
 import sqlite3
 import re
-from typing import Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from detector import create_detector
+from burst_grouping import group_bursts, sharpest
+from admission import AdmissionController, AdmissionMiddleware
+from profiling import ProfilingMiddleware, bind_profile
+from config import (
+    ADMISSION_MAX_CONCURRENCY, BOUNDED_MEMORY_MODE, MODEL_LOADING_RETRY_AFTER, BURST_GROUPING, DEFAULT_RACE_ID, DETECTOR_BACKEND, DIGIT_MIN_CONFIDENCE, MOSAIC_FALLBACK, OCR_BATCH_MODE,
+    OCR_EARLY_ACCEPT_CONFIDENCE, OCR_ENGINE, PREVIEW_DEFAULT_WIDTH, PREVIEW_MAX_AGE, PREVIEW_MAX_WIDTH, STORE_ORIGINALS,
+    THUMBNAIL_DEFAULT_SIZE, THUMBNAIL_MAX_SIZE
+)
+from digit_recognizer import DigitRecognizer
+from memory_pool import MemoryBudget, buffer_pool, estimate_image_bytes
+from mosaic_ocr import MosaicBatcher
+from ocr_scheduler import OcrStrategyScheduler
+from race_registry import RaceRegistryCache, init_race_tables
+from export import CONTENT_TYPES, iter_export
+from detection_store import (
+    DetectionWriter, get_detection, get_detections_by_photo, get_photos_by_plate, init_detections_table, photo_id_for
+)
+from previews import PhotoStore, PreviewCache, preview_key, quantize_size, render_annotated, render_crop
 
 # Configuración de la aplicación
 app = FastAPI(title="Grow Labs Races API", version="1.0.0")
 
+# Perfilado bajo demanda (encabezado X-Profile o muestreo de 1 cada N requests)
+app.add_middleware(ProfilingMiddleware, output_dir=Path(__file__).parent.parent / "profiles")
+
+# Control de admisión: descartar con 503 lo que esperaría más que el objetivo de latencia
+admission = AdmissionController()
+app.add_middleware(AdmissionMiddleware, controller=admission)
+
 # Configurar CORS para permitir comunicación con el frontend
 app.add_middleware(
     CORSMiddleware,
@@ -34,15 +64,61 @@ MODEL_PATH = BASE_DIR.parent / "models" / "yolov8n.pt"
 DATABASE_PATH.parent.mkdir(exist_ok=True)
 MODEL_PATH.parent.mkdir(exist_ok=True)
 
-# Cargar modelo YOLOv8 (se descargará automáticamente si no existe)
-try:
-    model = YOLO(MODEL_PATH)
-    print("[OK] Modelo YOLOv8 cargado correctamente")
-except Exception as e:
-    print(f"[WARNING] Error cargando modelo: {e}")
-    print("[INFO] Descargando modelo YOLOv8...")
-    model = YOLO('yolov8n.pt')
-    model.save(MODEL_PATH)
+# Detector de personas; el modelo YOLOv8 se carga en segundo plano al iniciar
+detector = create_detector(DETECTOR_BACKEND, MODEL_PATH)
+detector_load_thread = None
+
+def start_detector_load():
+    """Cargar el modelo en segundo plano si no hay ya una carga en curso"""
+    global detector_load_thread
+    if detector.loaded or (detector_load_thread is not None and detector_load_thread.is_alive()):
+        return
+    
+    def load():
+        try:
+            detector.load()
+        except Exception:
+            pass  # El error queda en detector.load_error y se informa en /health
+    
+    detector_load_thread = threading.Thread(target=load, name="detector-load", daemon=True)
+    detector_load_thread.start()
+
+def require_detector():
+    """Responder 503 mientras el modelo no está listo, en vez de esperarlo bloqueando un hilo"""
+    if detector.loaded:
+        return
+    if detector.load_error:
+        # Reintentar la carga en segundo plano para los próximos requests
+        start_detector_load()
+    raise HTTPException(
+        status_code=503,
+        detail="El modelo de detección todavía se está cargando",
+        headers={"Retry-After": str(MODEL_LOADING_RETRY_AFTER)}
+    )
+
+# Escritor en lotes de detecciones
+detection_writer = DetectionWriter(DATABASE_PATH)
+
+# Registros de corredores por carrera, cargados bajo demanda
+race_registries = RaceRegistryCache(DATABASE_PATH)
+
+# Hilos del pipeline de detección: YOLO y OCR corren fuera del event loop, tantos a la vez
+# como requests admite el control de admisión
+pipeline_executor = ThreadPoolExecutor(max_workers=ADMISSION_MAX_CONCURRENCY, thread_name_prefix="pipeline")
+
+async def run_in_pipeline(func, *args):
+    """Ejecutar trabajo de CPU en los hilos del pipeline sin bloquear el event loop"""
+    # Si el request se está perfilando, el hilo del pipeline también entra en el perfil
+    work = bind_profile(functools.partial(func, *args))
+    return await asyncio.get_running_loop().run_in_executor(pipeline_executor, work)
+
+# Originales de las fotos subidas y vistas previas generadas a partir de ellos
+photo_store = PhotoStore(BASE_DIR.parent / "photos")
+preview_cache = PreviewCache(BASE_DIR.parent / "previews")
+
+class RunnerIn(BaseModel):
+    plate_number: str
+    runner_name: str
 
 def init_database():
     """Inicializar la base de datos SQLite con tabla de corredores"""
@@ -92,101 +168,278 @@ def init_database():
     conn.close()
     print("[OK] Base de datos inicializada correctamente")
 
-def get_runner_by_plate(plate_number: str) -> Optional[str]:
-    """Buscar el nombre del corredor por número de placa"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
+def get_runner_by_plate(plate_number: str, race_id: str = DEFAULT_RACE_ID) -> Optional[str]:
+    """Buscar el nombre del corredor por número de placa dentro de una carrera"""
+    return race_registries.get_runner(race_id, plate_number)
+
+# Presupuesto de memoria para admitir imágenes en modo de memoria acotada
+memory_budget = MemoryBudget()
+
+MORPH_KERNEL = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 2))
+
+# Técnicas de preprocesamiento, calculadas sólo cuando una estrategia las usa.
+# dst permite escribir el resultado en un buffer reutilizado del pool.
+PREPROCESSORS = {
+    # Imagen original
+    "gray": lambda gray, dst=None: gray,
+    # Aplicar filtro gaussiano
+    "blur": lambda gray, dst=None: cv2.GaussianBlur(gray, (3, 3), 0, dst=dst),
+    # Aplicar umbralización adaptativa
+    "adaptive": lambda gray, dst=None: cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2, dst=dst),
+    # Aplicar umbralización OTSU
+    "otsu": lambda gray, dst=None: cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=dst)[1],
+    # Aplicar morfología para limpiar la imagen
+    "morph": lambda gray, dst=None: cv2.morphologyEx(gray, cv2.MORPH_CLOSE, MORPH_KERNEL, dst=dst),
+}
+
+# Configuraciones de Tesseract para probar
+TESSERACT_CONFIGS = {
+    "psm6_digits": r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789',  # Solo números
+    "psm8_digits": r'--oem 3 --psm 8 -c tessedit_char_whitelist=0123456789',  # Palabra única
+    "psm7_digits": r'--oem 3 --psm 7 -c tessedit_char_whitelist=0123456789',  # Línea única
+    "psm13_digits": r'--oem 3 --psm 13 -c tessedit_char_whitelist=0123456789',  # Línea cruda
+    "psm6": r'--oem 3 --psm 6',  # Sin restricción de caracteres
+    "psm8": r'--oem 3 --psm 8',  # Palabra única sin restricción
+}
+
+# Reconocedor liviano de dígitos (OCR_ENGINE = "digits"); se entrena al primer uso
+digit_recognizer = DigitRecognizer(MODEL_PATH.parent / "digits_knn.npz")
+
+# Planificador que aprende qué combinación gana en cada carrera o cámara
+ocr_scheduler = OcrStrategyScheduler(
+    DATABASE_PATH,
+    [f"{variant}|{config}" for variant in PREPROCESSORS for config in TESSERACT_CONFIGS]
+)
+
+def extract_plate_text(image: np.ndarray, context: str = DEFAULT_RACE_ID) -> str:
+    """Extraer texto de la imagen usando OCR con múltiples configuraciones.
     
-    cursor.execute('SELECT runner_name FROM runners WHERE plate_number = ?', (plate_number,))
-    result = cursor.fetchone()
+    Con OCR_ENGINE = "digits" primero se prueba el reconocedor liviano. Las combinaciones de preprocesamiento y configuración se prueban en el orden
+    que indica el planificador para el contexto (carrera o cámara).
+    """
+    # Motor rápido de dígitos; Tesseract queda como respaldo para lecturas dudosas
+    if OCR_ENGINE == "digits":
+        try:
+            reading = digit_recognizer.read(image)
+            if reading and reading["confidence"] >= DIGIT_MIN_CONFIDENCE:
+                return reading["text"]
+        except Exception as e:
+            print(f"Error en reconocedor de dígitos: {e}")
+    
+    # Tesseract se importa recién cuando se necesita OCR
+    pytesseract = import_timed("pytesseract")
     
-    conn.close()
-    return result[0] if result else None
-
-def extract_plate_text(image: np.ndarray) -> str:
-    """Extraer texto de la imagen usando OCR con múltiples configuraciones"""
     try:
-        # Convertir a escala de grises
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        
-        # Aplicar diferentes técnicas de preprocesamiento
-        processed_images = []
+        # En modo de memoria acotada las imágenes intermedias usan buffers del pool
+        pool = buffer_pool() if BOUNDED_MEMORY_MODE else None
         
-        # Imagen original
-        processed_images.append(gray)
-        
-        # Aplicar filtro gaussiano
-        blurred = cv2.GaussianBlur(gray, (3, 3), 0)
-        processed_images.append(blurred)
-        
-        # Aplicar umbralización adaptativa
-        thresh = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
-        processed_images.append(thresh)
-        
-        # Aplicar umbralización OTSU
-        _, otsu = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        processed_images.append(otsu)
+        # Convertir a escala de grises
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=pool.get("gray", image.shape[:2]) if pool else None)
         
-        # Aplicar morfología para limpiar la imagen
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 2))
-        morph = cv2.morphologyEx(gray, cv2.MORPH_CLOSE, kernel)
-        processed_images.append(morph)
-        
-        # Configuraciones de Tesseract para probar
-        configs = [
-            r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789',  # Solo números
-            r'--oem 3 --psm 8 -c tessedit_char_whitelist=0123456789',  # Palabra única
-            r'--oem 3 --psm 7 -c tessedit_char_whitelist=0123456789',  # Línea única
-            r'--oem 3 --psm 13 -c tessedit_char_whitelist=0123456789',  # Línea cruda
-            r'--oem 3 --psm 6',  # Sin restricción de caracteres
-            r'--oem 3 --psm 8',  # Palabra única sin restricción
-        ]
+        processed_images = {}
+        solved_variants = set()
+        tried = []
+        passes = 0
         
         best_text = ""
         best_confidence = 0
+        best_arm = None
         
-        # Probar todas las combinaciones de imágenes y configuraciones
-        for img in processed_images:
-            for config in configs:
-                try:
-                    # Extraer texto
-                    text = pytesseract.image_to_string(img, config=config).strip()
-                    
-                    # Limpiar y extraer solo números
-                    numbers = re.findall(r'\d+', text)
-                    clean_text = ''.join(numbers)
+        for arm in ocr_scheduler.plan(context):
+            variant, config_name = arm.split("|")
+            
+            # Como antes, una vez que una imagen da un número válido no se prueban más configuraciones
+            if variant in solved_variants:
+                continue
+            
+            if variant not in processed_images:
+                dst = pool.get(variant, gray.shape) if pool and variant != "gray" else None
+                processed_images[variant] = PREPROCESSORS[variant](gray, dst)
+            img = processed_images[variant]
+            config = TESSERACT_CONFIGS[config_name]
+            tried.append(arm)
+            
+            try:
+                # Extraer texto
+                text = pytesseract.image_to_string(img, config=config).strip()
+                passes += 1
+                
+                # Limpiar y extraer solo números
+                numbers = re.findall(r'\d+', text)
+                clean_text = ''.join(numbers)
+                
+                # Validar que sea un número de placa válido (2-4 dígitos)
+                if len(clean_text) >= 2 and len(clean_text) <= 4:
+                    solved_variants.add(variant)
+                    # Obtener confianza del OCR
+                    try:
+                        data = pytesseract.image_to_data(img, config=config, output_type=pytesseract.Output.DICT)
+                        passes += 1
+                        confidences = [int(conf) for conf in data['conf'] if int(conf) > 0]
+                        avg_confidence = sum(confidences) / len(confidences) if confidences else 0
+                        
+                        if avg_confidence > best_confidence:
+                            best_text = clean_text
+                            best_confidence = avg_confidence
+                            best_arm = arm
+                    except:
+                        # Si no podemos obtener confianza, usar el texto si es válido
+                        if not best_text:
+                            best_text = clean_text
+                            best_arm = arm
                     
-                    # Validar que sea un número de placa válido (2-4 dígitos)
-                    if len(clean_text) >= 2 and len(clean_text) <= 4:
-                        # Obtener confianza del OCR
-                        try:
-                            data = pytesseract.image_to_data(img, config=config, output_type=pytesseract.Output.DICT)
-                            confidences = [int(conf) for conf in data['conf'] if int(conf) > 0]
-                            avg_confidence = sum(confidences) / len(confidences) if confidences else 0
-                            
-                            if avg_confidence > best_confidence:
-                                best_text = clean_text
-                                best_confidence = avg_confidence
-                        except:
-                            # Si no podemos obtener confianza, usar el texto si es válido
-                            if not best_text:
-                                best_text = clean_text
+                    # Una lectura con confianza alta no necesita más intentos
+                    if best_confidence >= OCR_EARLY_ACCEPT_CONFIDENCE:
                         break
-                except:
-                    continue
+            except:
+                continue
         
+        ocr_scheduler.record(context, tried, best_arm, passes)
         return best_text
         
     except Exception as e:
         print(f"Error en OCR: {e}")
         return ""
 
+# Agrupa recortes (de una o varias imágenes) para leerlos en un solo mosaico
+mosaic_batcher = MosaicBatcher()
+
+def detect_plates(image: np.ndarray, race_id: str = DEFAULT_RACE_ID, ocr_context: Optional[str] = None) -> list:
+    """Detectar placas de corredores en una imagen decodificada"""
+    ocr_context = ocr_context or race_id
+    
+    # Detectar objetos con el detector configurado (ninguno en modo sin detector)
+    boxes = detector.detect(image)
+    
+    # Buscar placas usando múltiples estrategias
+    plates_detected = []
+    
+    # Estrategia 1: Detectar personas y buscar placas en sus regiones
+    torsos = []
+    for box in boxes:
+        # Obtener coordenadas del bounding box
+        x1, y1, x2, y2 = box["x1"], box["y1"], box["x2"], box["y2"]
+        confidence = box["confidence"]
+        class_id = box["class_id"]
+        
+        # Buscar personas (class_id 0 en COCO dataset)
+        if class_id == 0 and confidence > 0.3:
+            # Expandir región para incluir posible placa
+            height = y2 - y1
+            width = x2 - x1
+            
+            # Buscar placa en la región del torso (parte superior del cuerpo)
+            torso_y1 = max(0, int(y1 + height * 0.1))
+            torso_y2 = min(image.shape[0], int(y1 + height * 0.6))
+            torso_x1 = max(0, int(x1 - width * 0.1))
+            torso_x2 = min(image.shape[1], int(x2 + width * 0.1))
+            
+            torsos.append((confidence, torso_x1, torso_y1, torso_x2, torso_y2))
+    
+    # En modo mosaico todos los torsos se leen con una sola pasada de Tesseract
+    mosaic_results = [None] * len(torsos)
+    if OCR_BATCH_MODE == "mosaic" and torsos:
+        try:
+            mosaic_results = mosaic_batcher.recognize([image[y1:y2, x1:x2] for _, x1, y1, x2, y2 in torsos])
+        except Exception as e:
+            print(f"Error en OCR por mosaico: {e}")
+    
+    for (confidence, torso_x1, torso_y1, torso_x2, torso_y2), mosaic_result in zip(torsos, mosaic_results):
+        text_coordinates = None
+        if mosaic_result and 2 <= len(mosaic_result["text"]) <= 4:
+            plate_text = mosaic_result["text"]
+            text_box = mosaic_result["box"]
+            text_coordinates = {
+                "x1": torso_x1 + text_box["x1"],
+                "y1": torso_y1 + text_box["y1"],
+                "x2": torso_x1 + text_box["x2"],
+                "y2": torso_y1 + text_box["y2"]
+            }
+        elif OCR_BATCH_MODE == "mosaic" and not MOSAIC_FALLBACK:
+            continue
+        else:
+            # Intentar detectar placa en la región del torso
+            torso_region = image[torso_y1:torso_y2, torso_x1:torso_x2]
+            plate_text = extract_plate_text(torso_region, ocr_context)
+        
+        if plate_text and len(plate_text) >= 2:
+            # Buscar corredor en la base de datos
+            runner_name = get_runner_by_plate(plate_text, race_id)
+            
+            plate = {
+                "plate_number": plate_text,
+                "runner_name": runner_name,
+                "confidence": float(confidence),
+                "coordinates": {
+                    "x1": torso_x1,
+                    "y1": torso_y1,
+                    "x2": torso_x2,
+                    "y2": torso_y2
+                },
+                "method": "person_detection"
+            }
+            if text_coordinates:
+                plate["text_coordinates"] = text_coordinates
+            plates_detected.append(plate)
+    
+    # Estrategia 2: Si no se detectaron placas, buscar en toda la imagen
+    if not plates_detected:
+        # Dividir imagen en regiones y buscar placas
+        height, width = image.shape[:2]
+        
+        # Buscar en diferentes regiones de la imagen
+        regions = [
+            (0, 0, width//2, height//2),  # Cuadrante superior izquierdo
+            (width//2, 0, width, height//2),  # Cuadrante superior derecho
+            (0, height//2, width//2, height),  # Cuadrante inferior izquierdo
+            (width//2, height//2, width, height),  # Cuadrante inferior derecho
+        ]
+        
+        for x1, y1, x2, y2 in regions:
+            region = image[y1:y2, x1:x2]
+            plate_text = extract_plate_text(region, ocr_context)
+            
+            if plate_text and len(plate_text) >= 2:
+                runner_name = get_runner_by_plate(plate_text, race_id)
+                
+                plates_detected.append({
+                    "plate_number": plate_text,
+                    "runner_name": runner_name,
+                    "confidence": 0.7,  # Confianza media para detección por región
+                    "coordinates": {
+                        "x1": int(x1),
+                        "y1": int(y1),
+                        "x2": int(x2),
+                        "y2": int(y2)
+                    },
+                    "method": "region_search"
+                })
+                break  # Si encontramos una placa, no buscar más
+    
+    return plates_detected
+
 @app.on_event("startup")
 async def startup_event():
     """Inicializar la aplicación"""
     print("[STARTUP] Iniciando Grow Labs Races API...")
-    init_database()
-    print("[OK] API lista para recibir requests")
+    with timed_phase("init_database"):
+        init_database()
+        init_race_tables(DATABASE_PATH)
+        init_detections_table(DATABASE_PATH)
+        ocr_scheduler.init_table()
+    detection_writer.start()
+    
+    # Cargar el modelo sin bloquear el arranque: las consultas de corredores se atienden mientras tanto
+    start_detector_load()
+    
+    print(f"[OK] API lista para recibir requests en {startup_report()['seconds_since_start']:.2f}s")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Terminar las detecciones en curso y volcar las pendientes antes de cerrar"""
+    pipeline_executor.shutdown(wait=True)
+    detection_writer.stop()
+    ocr_scheduler.save()
 
 @app.get("/")
 async def root():
@@ -195,214 +448,344 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Verificar estado de la API"""
+    """Verificar estado de la API; "loading" mientras el modelo no está listo para detectar"""
     return {
-        "status": "healthy",
-        "model_loaded": model is not None,
-        "database_exists": DATABASE_PATH.exists()
+        "status": "healthy" if detector.loaded else "loading",
+        "ready": detector.loaded,
+        "detector": detector.name,
+        "model_loaded": detector.loaded,
+        "model_error": detector.load_error,
+        "database_exists": DATABASE_PATH.exists(),
+        "races_loaded": race_registries.loaded_races(),
+        "memory": memory_budget.status() if BOUNDED_MEMORY_MODE else None,
+        "admission": admission.status(),
+        "previews": preview_cache.status(),
+        "originals": photo_store.status() if STORE_ORIGINALS else None
     }
 
+@app.get("/ready")
+async def readiness_check():
+    """Chequeo de disponibilidad para balanceadores: 503 hasta que el modelo esté cargado"""
+    if not detector.loaded:
+        return JSONResponse(
+            status_code=503,
+            content={"ready": False, "model_error": detector.load_error},
+            headers={"Retry-After": str(MODEL_LOADING_RETRY_AFTER)}
+        )
+    return {"ready": True}
+
+@app.get("/startup-report")
+async def get_startup_report():
+    """Tiempos de import y de inicialización del worker"""
+    return startup_report()
+
+def process_upload(contents: bytes, race_id: str, ocr_context: str):
+    """Decodificar una subida y detectar sus placas; corre en un hilo del pipeline.
+    
+    Devuelve (placas, memoria), con placas None si la imagen no se pudo decodificar.
+    """
+    if BOUNDED_MEMORY_MODE:
+        buffer_pool().begin_request()
+    
+    image = cv2.imdecode(np.frombuffer(contents, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None, None
+    
+    plates_detected = detect_plates(image, race_id, ocr_context)
+    
+    # Bytes usados en el pico: subida, imagen decodificada y buffers intermedios
+    memory = None
+    if BOUNDED_MEMORY_MODE:
+        memory = {"peak_bytes": len(contents) + image.nbytes + buffer_pool().request_bytes()}
+    return plates_detected, memory
+
 @app.post("/detect-plate")
-async def detect_plate(file: UploadFile = File(...)):
+async def detect_plate(file: UploadFile = File(...), race_id: str = Form(DEFAULT_RACE_ID),
+                       camera_id: Optional[str] = Form(None)):
     """Detectar placa de corredor en imagen"""
+    require_detector()
+    reserved_bytes = 0
     try:
+        # Contexto para el planificador de OCR: la cámara dentro de la carrera, si se indica
+        ocr_context = f"{race_id}:{camera_id}" if camera_id else race_id
+        
         # Validar tipo de archivo
         if not file.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="El archivo debe ser una imagen")
         
         # Leer imagen
         contents = await file.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
         
-        if image is None:
-            raise HTTPException(status_code=400, detail="No se pudo procesar la imagen")
-        
-        # Detectar objetos con YOLOv8
-        results = model(image)
-        
-        # Buscar placas usando múltiples estrategias
-        plates_detected = []
+        # En modo de memoria acotada, esperar a que haya memoria antes de decodificar
+        if BOUNDED_MEMORY_MODE:
+            reserved_bytes = await memory_budget.acquire(estimate_image_bytes(contents))
         
-        # Estrategia 1: Detectar personas y buscar placas en sus regiones
-        for result in results:
-            boxes = result.boxes
-            if boxes is not None:
-                for box in boxes:
-                    # Obtener coordenadas del bounding box
-                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                    confidence = box.conf[0].cpu().numpy()
-                    class_id = int(box.cls[0].cpu().numpy())
-                    
-                    # Buscar personas (class_id 0 en COCO dataset)
-                    if class_id == 0 and confidence > 0.3:
-                        # Expandir región para incluir posible placa
-                        height = y2 - y1
-                        width = x2 - x1
-                        
-                        # Buscar placa en la región del torso (parte superior del cuerpo)
-                        torso_y1 = max(0, int(y1 + height * 0.1))
-                        torso_y2 = min(image.shape[0], int(y1 + height * 0.6))
-                        torso_x1 = max(0, int(x1 - width * 0.1))
-                        torso_x2 = min(image.shape[1], int(x2 + width * 0.1))
-                        
-                        torso_region = image[torso_y1:torso_y2, torso_x1:torso_x2]
-                        
-                        # Intentar detectar placa en la región del torso
-                        plate_text = extract_plate_text(torso_region)
-                        
-                        if plate_text and len(plate_text) >= 2:
-                            # Buscar corredor en la base de datos
-                            runner_name = get_runner_by_plate(plate_text)
-                            
-                            plates_detected.append({
-                                "plate_number": plate_text,
-                                "runner_name": runner_name,
-                                "confidence": float(confidence),
-                                "coordinates": {
-                                    "x1": torso_x1,
-                                    "y1": torso_y1,
-                                    "x2": torso_x2,
-                                    "y2": torso_y2
-                                },
-                                "method": "person_detection"
-                            })
+        # Decodificar y detectar placas con el pipeline completo, fuera del event loop
+        plates_detected, memory = await run_in_pipeline(process_upload, contents, race_id, ocr_context)
         
-        # Estrategia 2: Si no se detectaron placas, buscar en toda la imagen
-        if not plates_detected:
-            # Dividir imagen en regiones y buscar placas
-            height, width = image.shape[:2]
-            
-            # Buscar en diferentes regiones de la imagen
-            regions = [
-                (0, 0, width//2, height//2),  # Cuadrante superior izquierdo
-                (width//2, 0, width, height//2),  # Cuadrante superior derecho
-                (0, height//2, width//2, height),  # Cuadrante inferior izquierdo
-                (width//2, height//2, width, height),  # Cuadrante inferior derecho
-            ]
-            
-            for x1, y1, x2, y2 in regions:
-                region = image[y1:y2, x1:x2]
-                plate_text = extract_plate_text(region)
-                
-                if plate_text and len(plate_text) >= 2:
-                    runner_name = get_runner_by_plate(plate_text)
-                    
-                    plates_detected.append({
-                        "plate_number": plate_text,
-                        "runner_name": runner_name,
-                        "confidence": 0.7,  # Confianza media para detección por región
-                        "coordinates": {
-                            "x1": int(x1),
-                            "y1": int(y1),
-                            "x2": int(x2),
-                            "y2": int(y2)
-                        },
-                        "method": "region_search"
-                    })
-                    break  # Si encontramos una placa, no buscar más
+        if plates_detected is None:
+            raise HTTPException(status_code=400, detail="No se pudo procesar la imagen")
         
         if not plates_detected:
             return JSONResponse(
                 status_code=404,
                 content={
                     "message": "No se detectaron placas en la imagen",
-                    "plates": []
+                    "plates": [],
+                    **({"memory": memory} if memory else {})
                 }
             )
         
+        # Guardar detecciones en segundo plano, y el original para las vistas previas
+        photo_id = photo_id_for(contents)
+        if STORE_ORIGINALS:
+            await run_in_pipeline(photo_store.save, photo_id, contents)
+        detection_writer.add(photo_id, file.filename, plates_detected, race_id)
+        
         return {
             "message": f"Se detectaron {len(plates_detected)} placa(s)",
-            "plates": plates_detected
+            "photo_id": photo_id,
+            "plates": plates_detected,
+            **({"memory": memory} if memory else {})
         }
         
     except Exception as e:
         print(f"Error procesando imagen: {e}")
         raise HTTPException(status_code=500, detail=f"Error procesando imagen: {str(e)}")
+    finally:
+        await memory_budget.release(reserved_bytes)
 
-@app.post("/debug-detect")
-async def debug_detect(file: UploadFile = File(...)):
-    """Endpoint de debug para probar la detección paso a paso"""
-    try:
-        # Leer imagen
-        contents = await file.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+def process_batch(photos: List[dict], race_id: str, ocr_context: str) -> tuple:
+    """Agrupar las fotos en ráfagas y detectar en la más nítida de cada una; corre en un hilo del pipeline"""
+    if BOUNDED_MEMORY_MODE:
+        buffer_pool().begin_request()
+    
+    # Agrupar fotos casi idénticas y detectar sólo en la más nítida de cada grupo
+    if BURST_GROUPING and len(photos) > 1:
+        groups = group_bursts(photos)
+    else:
+        groups = [[photo] for photo in photos]
+    
+    results = []
+    for burst_index, group in enumerate(groups):
+        representative = sharpest(group) if len(group) > 1 else group[0]
+        image = cv2.imdecode(np.frombuffer(representative["contents"], np.uint8), cv2.IMREAD_COLOR)
+        plates = detect_plates(image, race_id, ocr_context) if image is not None else []
         
-        if image is None:
-            raise HTTPException(status_code=400, detail="No se pudo procesar la imagen")
+        for photo in group:
+            photo_plates = plates
+            if photo is not representative:
+                photo_plates = [dict(plate, method="burst_propagated") for plate in plates]
+            if photo_plates:
+                if STORE_ORIGINALS:
+                    photo_store.save(photo["hash"], photo["contents"])
+                detection_writer.add(photo["hash"], photo["key"], photo_plates, race_id)
+            results.append({
+                "filename": photo["key"],
+                "photo_id": photo["hash"],
+                "burst": burst_index,
+                "representative": photo is representative,
+                "plates": photo_plates
+            })
+    return results, len(groups)
+
+@app.post("/detect-batch")
+async def detect_batch(files: List[UploadFile] = File(...), race_id: str = Form(DEFAULT_RACE_ID),
+                       camera_id: Optional[str] = Form(None)):
+    """Detectar placas en un lote de fotos, procesando una sola foto por ráfaga"""
+    require_detector()
+    reserved_bytes = 0
+    try:
+        ocr_context = f"{race_id}:{camera_id}" if camera_id else race_id
         
-        debug_info = {
-            "image_shape": image.shape,
-            "detection_steps": []
-        }
+        photos = []
+        for file in files:
+            contents = await file.read()
+            photos.append({"key": file.filename, "contents": contents, "hash": photo_id_for(contents)})
         
-        # Detectar objetos con YOLOv8
-        results = model(image)
+        # Se retienen todas las subidas pero se decodifica una foto a la vez: reservar las
+        # subidas más la imagen decodificada más grande del lote
+        if BOUNDED_MEMORY_MODE:
+            uploads = sum(len(photo["contents"]) for photo in photos)
+            decoded = max((estimate_image_bytes(photo["contents"]) - len(photo["contents"]) for photo in photos), default=0)
+            reserved_bytes = await memory_budget.acquire(uploads + decoded)
         
-        # Información de debug sobre detecciones
-        for i, result in enumerate(results):
-            boxes = result.boxes
-            if boxes is not None:
-                for j, box in enumerate(boxes):
-                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                    confidence = box.conf[0].cpu().numpy()
-                    class_id = int(box.cls[0].cpu().numpy())
-                    
-                    debug_info["detection_steps"].append({
-                        "step": f"Detection {i}-{j}",
-                        "class_id": class_id,
-                        "confidence": float(confidence),
-                        "coordinates": {
-                            "x1": int(x1), "y1": int(y1),
-                            "x2": int(x2), "y2": int(y2)
-                        },
-                        "is_person": class_id == 0
-                    })
+        results, bursts = await run_in_pipeline(process_batch, photos, race_id, ocr_context)
         
-        # Probar OCR en diferentes regiones
-        height, width = image.shape[:2]
-        regions = [
-            ("center", width//4, height//4, 3*width//4, 3*height//4),
-            ("top_half", 0, 0, width, height//2),
-            ("bottom_half", 0, height//2, width, height),
-        ]
-        
-        ocr_results = []
-        for name, x1, y1, x2, y2 in regions:
-            region = image[y1:y2, x1:x2]
-            plate_text = extract_plate_text(region)
-            ocr_results.append({
-                "region": name,
-                "coordinates": {"x1": x1, "y1": y1, "x2": x2, "y2": y2},
-                "extracted_text": plate_text,
-                "found_in_db": get_runner_by_plate(plate_text) is not None if plate_text else False
-            })
-        
-        debug_info["ocr_results"] = ocr_results
+        return {
+            "message": f"Se procesaron {len(photos)} foto(s) en {bursts} ráfaga(s)",
+            "results": results
+        }
         
-        return debug_info
+    except Exception as e:
+        print(f"Error procesando lote: {e}")
+        raise HTTPException(status_code=500, detail=f"Error procesando lote: {str(e)}")
+    finally:
+        await memory_budget.release(reserved_bytes)
+
+def debug_pipeline(contents: bytes, race_id: str) -> dict:
+    """Detección paso a paso de una imagen; corre en un hilo del pipeline"""
+    nparr = np.frombuffer(contents, np.uint8)
+    image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    
+    if image is None:
+        raise HTTPException(status_code=400, detail="No se pudo procesar la imagen")
+    
+    debug_info = {
+        "image_shape": image.shape,
+        "detection_steps": []
+    }
+    
+    # Detectar objetos con el detector configurado
+    for i, box in enumerate(detector.detect(image)):
+        debug_info["detection_steps"].append({
+            "step": f"Detection {i}",
+            "class_id": box["class_id"],
+            "confidence": box["confidence"],
+            "coordinates": {
+                "x1": int(box["x1"]), "y1": int(box["y1"]),
+                "x2": int(box["x2"]), "y2": int(box["y2"])
+            },
+            "is_person": box["class_id"] == 0
+        })
+    
+    # Probar OCR en diferentes regiones
+    height, width = image.shape[:2]
+    regions = [
+        ("center", width//4, height//4, 3*width//4, 3*height//4),
+        ("top_half", 0, 0, width, height//2),
+        ("bottom_half", 0, height//2, width, height),
+    ]
+    
+    ocr_results = []
+    for name, x1, y1, x2, y2 in regions:
+        region = image[y1:y2, x1:x2]
+        plate_text = extract_plate_text(region, race_id)
+        ocr_results.append({
+            "region": name,
+            "coordinates": {"x1": x1, "y1": y1, "x2": x2, "y2": y2},
+            "extracted_text": plate_text,
+            "found_in_db": get_runner_by_plate(plate_text, race_id) is not None if plate_text else False
+        })
+    
+    debug_info["ocr_results"] = ocr_results
+    
+    return debug_info
+
+@app.post("/debug-detect")
+async def debug_detect(file: UploadFile = File(...), race_id: str = Form(DEFAULT_RACE_ID)):
+    """Endpoint de debug para probar la detección paso a paso"""
+    require_detector()
+    try:
+        # Leer imagen
+        contents = await file.read()
+        return await run_in_pipeline(debug_pipeline, contents, race_id)
         
     except Exception as e:
         return {"error": str(e)}
 
 @app.get("/runners")
-async def get_runners():
-    """Obtener lista de todos los corredores"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT plate_number, runner_name FROM runners ORDER BY plate_number')
-    runners = cursor.fetchall()
-    
-    conn.close()
+async def get_runners(race_id: str = DEFAULT_RACE_ID):
+    """Obtener lista de todos los corredores de una carrera"""
+    runners = sorted(race_registries.get_registry(race_id).items())
     
     return {
+        "race_id": race_id,
         "runners": [
             {"plate_number": plate, "runner_name": name}
             for plate, name in runners
         ]
     }
 
+@app.post("/races/{race_id}/runners")
+def register_race_runners(race_id: str, runners: List[RunnerIn]):
+    """Cargar o actualizar en bloque los corredores de una carrera"""
+    count = race_registries.register_runners(
+        race_id, [(runner.plate_number, runner.runner_name) for runner in runners]
+    )
+    return {"race_id": race_id, "registered": count}
+
+@app.get("/runners/{plate_number}/photos")
+async def get_runner_photos(plate_number: str, race_id: str = DEFAULT_RACE_ID):
+    """Obtener todas las fotos donde se detectó un dorsal en una carrera"""
+    photos = get_photos_by_plate(DATABASE_PATH, plate_number, race_id)
+    
+    return {
+        "race_id": race_id,
+        "plate_number": plate_number,
+        "runner_name": get_runner_by_plate(plate_number, race_id),
+        "photos": photos
+    }
+
+@app.get("/export")
+def export_detections(format: str = "csv", race_id: Optional[str] = None, since: Optional[str] = None,
+                      until: Optional[str] = None, min_confidence: Optional[float] = None):
+    """Exportar detecciones con el nombre del corredor en CSV, NDJSON o Parquet"""
+    try:
+        chunks = iter_export(DATABASE_PATH, format, race_id=race_id, since=since, until=until,
+                             min_confidence=min_confidence)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    filename = f"detecciones-{race_id or 'todas'}.{format}"
+    return StreamingResponse(
+        chunks,
+        media_type=CONTENT_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+def preview_response(request: Request, key: str, render) -> Response:
+    """Responder una vista previa cacheada, o 304 si el cliente ya tiene esa versión"""
+    etag = f'"{key}"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={PREVIEW_MAX_AGE}"}
+    
+    if_none_match = request.headers.get("if-none-match", "")
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    if etag in candidates or "*" in candidates:
+        return Response(status_code=304, headers=headers)
+    
+    try:
+        data = preview_cache.get_or_render(key, render)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return Response(content=data, media_type="image/jpeg", headers=headers)
+
+def find_original(photo_id: str, photo_path: Optional[str]) -> Path:
+    path = photo_store.find(photo_id, photo_path)
+    if path is None:
+        raise ValueError("La foto original no está disponible")
+    return path
+
+@app.get("/photos/{photo_id}/preview")
+def get_photo_preview(photo_id: str, request: Request, width: int = PREVIEW_DEFAULT_WIDTH):
+    """Foto reducida con las cajas y dorsales detectados dibujados"""
+    detections = get_detections_by_photo(DATABASE_PATH, photo_id)
+    if not detections:
+        raise HTTPException(status_code=404, detail="No hay detecciones para esa foto")
+    
+    width = quantize_size(width, PREVIEW_MAX_WIDTH)
+    key = preview_key("preview", photo_id, width, detections)
+    return preview_response(request, key, lambda: render_annotated(
+        find_original(photo_id, detections[0]["photo_path"]), detections, width
+    ))
+
+@app.get("/detections/{detection_id}/thumbnail")
+def get_detection_thumbnail(detection_id: int, request: Request, size: int = THUMBNAIL_DEFAULT_SIZE):
+    """Miniatura del recorte de una detección"""
+    detection = get_detection(DATABASE_PATH, detection_id)
+    if detection is None:
+        raise HTTPException(status_code=404, detail="Detección no encontrada")
+    
+    size = quantize_size(size, THUMBNAIL_MAX_SIZE)
+    key = preview_key("thumbnail", detection["photo_id"], size, [detection])
+    return preview_response(request, key, lambda: render_crop(
+        find_original(detection["photo_id"], detection["photo_path"]), detection["coordinates"], size
+    ))
+
+@app.get("/ocr-stats")
+async def get_ocr_stats(context: str = DEFAULT_RACE_ID):
+    """Ver qué estrategias de OCR están ganando en una carrera o cámara"""
+    return ocr_scheduler.summary(context)
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,139 @@
+"""Modo de memoria acotada: pools de buffers reutilizables y presupuesto global.
+
+Cada hilo de trabajo mantiene buffers preasignados que se reutilizan como
+salida (dst=) de OpenCV en lugar de crear imágenes nuevas por recorte. Un
+presupuesto global de bytes frena la admisión de imágenes nuevas cuando la
+memoria en uso llegaría al límite, para que los picos de subidas no terminen
+con el proceso eliminado por falta de memoria.
+"""
+import asyncio
+import io
+import threading
+import weakref
+from typing import Dict, Tuple
+
+import numpy as np
+
+from config import MEMORY_BUDGET_BYTES, MEMORY_POOL_MAX_SLOT_BYTES
+
+
+class BufferPool:
+    """Buffers con nombre reutilizables por un único hilo"""
+
+    def __init__(self, max_slot_bytes: int = MEMORY_POOL_MAX_SLOT_BYTES):
+        self.max_slot_bytes = max_slot_bytes
+        self._slots: Dict[str, np.ndarray] = {}
+        self._request_bytes: Dict[str, int] = {}
+
+    def begin_request(self):
+        """Reiniciar la contabilidad de bytes usados por el request actual"""
+        self._request_bytes = {}
+
+    def get(self, name: str, shape: Tuple[int, ...], dtype=np.uint8) -> np.ndarray:
+        """Obtener un buffer contiguo de la forma pedida, reutilizando memoria si se puede"""
+        dtype = np.dtype(dtype)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        self._request_bytes[name] = max(self._request_bytes.get(name, 0), nbytes)
+
+        # Imágenes demasiado grandes no se guardan en el pool
+        if nbytes > self.max_slot_bytes:
+            return np.empty(shape, dtype=dtype)
+
+        slot = self._slots.get(name)
+        if slot is None or slot.nbytes < nbytes:
+            slot = np.empty(nbytes, dtype=np.uint8)
+            self._slots[name] = slot
+        return slot[:nbytes].view(dtype).reshape(shape)
+
+    def request_bytes(self) -> int:
+        """Bytes de buffers usados simultáneamente por el request actual"""
+        return sum(self._request_bytes.values())
+
+    def pooled_bytes(self) -> int:
+        """Bytes preasignados que mantiene el pool"""
+        # Puede leerse desde otro hilo: copiar los valores antes de recorrerlos
+        return sum(slot.nbytes for slot in list(self._slots.values()))
+
+
+_local = threading.local()
+
+# Pools de todos los hilos vivos; el de un hilo que termina desaparece solo
+_pools: "weakref.WeakSet[BufferPool]" = weakref.WeakSet()
+
+
+def buffer_pool() -> BufferPool:
+    """Pool del hilo actual"""
+    pool = getattr(_local, "pool", None)
+    if pool is None:
+        pool = BufferPool()
+        _local.pool = pool
+        _pools.add(pool)
+    return pool
+
+
+def total_pooled_bytes() -> int:
+    """Bytes preasignados en los pools de todos los hilos"""
+    return sum(pool.pooled_bytes() for pool in list(_pools))
+
+
+def estimate_image_bytes(contents: bytes) -> int:
+    """Estimar la memoria de un request leyendo sólo el encabezado de la imagen"""
+    from PIL import Image
+
+    try:
+        width, height = Image.open(io.BytesIO(contents)).size
+    except Exception:
+        # Sin encabezado legible, suponer una foto de 24 MP
+        width, height = 6000, 4000
+    # Imagen BGR decodificada más la subida original
+    return width * height * 3 + len(contents)
+
+
+class MemoryBudget:
+    """Presupuesto global de bytes para admitir imágenes nuevas"""
+
+    def __init__(self, budget_bytes: int = MEMORY_BUDGET_BYTES):
+        self.budget_bytes = budget_bytes
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.waiting = 0
+        self._condition = None
+
+    def _get_condition(self) -> asyncio.Condition:
+        # Se crea en el event loop que lo usa
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def acquire(self, nbytes: int) -> int:
+        """Esperar hasta que haya memoria disponible y reservarla"""
+        # Un request más grande que el presupuesto se admite sólo cuando no hay otros
+        nbytes = min(nbytes, self.budget_bytes)
+        condition = self._get_condition()
+        async with condition:
+            self.waiting += 1
+            try:
+                await condition.wait_for(lambda: self.in_use + nbytes <= self.budget_bytes)
+            finally:
+                self.waiting -= 1
+            self.in_use += nbytes
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+        return nbytes
+
+    async def release(self, nbytes: int):
+        """Liberar memoria reservada"""
+        if not nbytes:
+            return
+        condition = self._get_condition()
+        async with condition:
+            self.in_use -= nbytes
+            condition.notify_all()
+
+    def status(self) -> dict:
+        return {
+            "budget_bytes": self.budget_bytes,
+            "in_use_bytes": self.in_use,
+            "peak_in_use_bytes": self.peak_in_use,
+            "waiting_requests": self.waiting,
+            "pooled_bytes": total_pooled_bytes(),
+        }
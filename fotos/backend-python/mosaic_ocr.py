@@ -0,0 +1,154 @@
+"""OCR en lote sobre un mosaico de recortes.
+
+En una foto grupal cada torso detectado pasa por su propia serie de llamadas a
+Tesseract, y cada llamada paga el arranque y el análisis de diseño. Este módulo
+normaliza los recortes, los apila en una sola página separados por franjas
+blancas, ejecuta una única pasada con cajas por palabra y devuelve los dígitos
+reconocidos a su recorte de origen, con coordenadas dentro del recorte.
+
+MosaicBatcher además junta recortes de varios hilos (por ejemplo, los workers
+del daemon de ingesta) en un mismo mosaico.
+"""
+import re
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from config import (
+    MOSAIC_BATCH_WINDOW,
+    MOSAIC_CROP_HEIGHT,
+    MOSAIC_CROP_MAX_WIDTH,
+    MOSAIC_MAX_CROPS,
+    MOSAIC_SEPARATOR,
+    MOSAIC_TESSERACT_CONFIG,
+)
+from startup_report import import_timed
+
+
+def normalize_crop(crop: np.ndarray) -> Tuple[np.ndarray, float]:
+    """Pasar a grises, escalar a altura fija y binarizar; devuelve la imagen y la escala"""
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    height, width = gray.shape[:2]
+    scale = min(MOSAIC_CROP_HEIGHT / max(1, height), MOSAIC_CROP_MAX_WIDTH / max(1, width))
+    resized = cv2.resize(gray, (max(1, int(width * scale)), max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+    _, binary = cv2.threshold(resized, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return binary, scale
+
+
+def build_mosaic(crops: List[np.ndarray]):
+    """Apilar los recortes verticalmente con franjas de separación.
+
+    Devuelve el mosaico y, por recorte, (y0, y1, x0, escala) para ubicar las palabras.
+    """
+    normalized = [normalize_crop(crop) for crop in crops]
+    width = max(img.shape[1] for img, _ in normalized) + 2 * MOSAIC_SEPARATOR
+    height = sum(img.shape[0] for img, _ in normalized) + (len(normalized) + 1) * MOSAIC_SEPARATOR
+
+    mosaic = np.full((height, width), 255, dtype=np.uint8)
+    placements = []
+    y = MOSAIC_SEPARATOR
+    for img, scale in normalized:
+        h, w = img.shape
+        mosaic[y:y + h, MOSAIC_SEPARATOR:MOSAIC_SEPARATOR + w] = img
+        placements.append((y, y + h, MOSAIC_SEPARATOR, scale))
+        y += h + MOSAIC_SEPARATOR
+    return mosaic, placements
+
+
+def recognize_crops(crops: List[np.ndarray]) -> List[Optional[dict]]:
+    """Reconocer los dígitos de varios recortes con una sola pasada de Tesseract.
+
+    Por recorte devuelve {"text", "confidence", "box"} con la caja de los dígitos en
+    coordenadas del recorte, o None si no se leyó nada.
+    """
+    if not crops:
+        return []
+    pytesseract = import_timed("pytesseract")
+
+    mosaic, placements = build_mosaic(crops)
+    data = pytesseract.image_to_data(mosaic, config=MOSAIC_TESSERACT_CONFIG, output_type=pytesseract.Output.DICT)
+
+    # Agrupar las palabras por el recorte en cuya franja cae su centro
+    words = [[] for _ in crops]
+    for text, conf, left, top, width, height in zip(
+            data["text"], data["conf"], data["left"], data["top"], data["width"], data["height"]):
+        digits = "".join(re.findall(r"\d+", str(text)))
+        if not digits or float(conf) <= 0:
+            continue
+        center_y = top + height / 2
+        for index, (y0, y1, x0, scale) in enumerate(placements):
+            if y0 <= center_y < y1:
+                words[index].append((left, digits, float(conf), (left, top, width, height)))
+                break
+
+    results = []
+    for index, crop_words in enumerate(words):
+        if not crop_words:
+            results.append(None)
+            continue
+        crop_words.sort()
+        y0, _, x0, scale = placements[index]
+        lefts = [(l - x0) / scale for _, _, _, (l, _, _, _) in crop_words]
+        tops = [(t - y0) / scale for _, _, _, (_, t, _, _) in crop_words]
+        rights = [(l + w - x0) / scale for _, _, _, (l, _, w, _) in crop_words]
+        bottoms = [(t + h - y0) / scale for _, _, _, (_, t, _, h) in crop_words]
+        results.append({
+            "text": "".join(digits for _, digits, _, _ in crop_words),
+            "confidence": sum(conf for _, _, conf, _ in crop_words) / len(crop_words),
+            "box": {
+                "x1": int(min(lefts)), "y1": int(min(tops)),
+                "x2": int(max(rights)), "y2": int(max(bottoms)),
+            },
+        })
+    return results
+
+
+class MosaicBatcher:
+    """Junta recortes de varios hilos en un mismo mosaico.
+
+    El primer hilo que llega actúa de líder: espera la ventana de agrupamiento,
+    procesa todo lo pendiente en mosaicos de hasta max_crops y entrega los
+    resultados al resto. Con ventana 0 no se espera a otros hilos.
+    """
+
+    def __init__(self, window: float = MOSAIC_BATCH_WINDOW, max_crops: int = MOSAIC_MAX_CROPS):
+        self.window = window
+        self.max_crops = max_crops
+        self._pending = []
+        self._leader_active = False
+        self._lock = threading.Lock()
+
+    def recognize(self, crops: List[np.ndarray]) -> List[Optional[dict]]:
+        futures = [Future() for _ in crops]
+        with self._lock:
+            self._pending.extend(zip(crops, futures))
+            leader = not self._leader_active
+            self._leader_active = True
+
+        if leader:
+            if self.window:
+                time.sleep(self.window)
+            self._drain()
+
+        return [future.result() for future in futures]
+
+    def _drain(self):
+        while True:
+            with self._lock:
+                batch = self._pending[:self.max_crops]
+                del self._pending[:self.max_crops]
+                if not batch:
+                    self._leader_active = False
+                    return
+
+            try:
+                results = recognize_crops([crop for crop, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
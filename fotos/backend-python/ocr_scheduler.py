@@ -0,0 +1,175 @@
+"""Planificador adaptativo de estrategias de OCR.
+
+Cada estrategia es un par (preprocesamiento, configuración de Tesseract). El
+par ganador depende del diseño del dorsal y de la luz de cada carrera, así que
+se registra qué estrategias producen la placa aceptada y se reordenan los
+intentos por contexto (carrera o cámara) con muestreo de Thompson. Las
+estrategias que casi nunca ganan se podan, salvo una pequeña fracción de
+exploración. Las estadísticas se guardan en SQLite.
+"""
+import random
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from config import (
+    OCR_SCHEDULER_EXPLORATION,
+    OCR_SCHEDULER_MIN_TRIALS,
+    OCR_SCHEDULER_PRUNE_RATE,
+    OCR_SCHEDULER_SAVE_EVERY,
+)
+
+
+class ArmStats:
+    """Intentos y victorias de una estrategia en un contexto"""
+
+    __slots__ = ("attempts", "wins")
+
+    def __init__(self, attempts: int = 0, wins: int = 0):
+        self.attempts = attempts
+        self.wins = wins
+
+    @property
+    def win_rate(self) -> float:
+        return self.wins / self.attempts if self.attempts else 0.0
+
+
+class OcrStrategyScheduler:
+    """Ordena y poda estrategias de OCR según lo aprendido en cada contexto"""
+
+    def __init__(self, database_path: Path, arms: List[str],
+                 exploration: float = OCR_SCHEDULER_EXPLORATION,
+                 min_trials: int = OCR_SCHEDULER_MIN_TRIALS,
+                 prune_rate: float = OCR_SCHEDULER_PRUNE_RATE,
+                 save_every: int = OCR_SCHEDULER_SAVE_EVERY):
+        self.database_path = database_path
+        self.arms = list(arms)
+        self.exploration = exploration
+        self.min_trials = min_trials
+        self.prune_rate = prune_rate
+        self.save_every = save_every
+        # contexto -> estrategia -> estadísticas
+        self._stats: Dict[str, Dict[str, ArmStats]] = {}
+        # contexto -> [recortes procesados, pasadas de Tesseract]
+        self._passes: Dict[str, List[int]] = {}
+        self._dirty = set()
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def init_table(self):
+        """Crear la tabla de estadísticas y cargar lo guardado"""
+        conn = sqlite3.connect(self.database_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ocr_strategy_stats (
+                context TEXT NOT NULL,
+                arm TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                wins INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (context, arm)
+            )
+        ''')
+        conn.commit()
+
+        cursor.execute('SELECT context, arm, attempts, wins FROM ocr_strategy_stats')
+        with self._lock:
+            for context, arm, attempts, wins in cursor.fetchall():
+                self._stats.setdefault(context, {})[arm] = ArmStats(attempts, wins)
+        conn.close()
+
+    def _context_stats(self, context: str) -> Dict[str, ArmStats]:
+        stats = self._stats.setdefault(context, {})
+        for arm in self.arms:
+            stats.setdefault(arm, ArmStats())
+        return stats
+
+    def plan(self, context: str) -> List[str]:
+        """Devolver las estrategias a intentar, en orden, para un contexto"""
+        with self._lock:
+            stats = self._context_stats(context)
+            samples = {
+                arm: random.betavariate(s.wins + 1, s.attempts - s.wins + 1)
+                for arm, s in stats.items() if arm in self.arms
+            }
+
+        ordered = sorted(samples, key=samples.get, reverse=True)
+
+        # Podar las que ya se probaron bastante y casi nunca ganan
+        kept, pruned = [], []
+        for arm in ordered:
+            s = stats[arm]
+            if s.attempts >= self.min_trials and s.win_rate < self.prune_rate:
+                pruned.append(arm)
+            else:
+                kept.append(arm)
+
+        # Mantener algo de exploración sobre las podadas
+        explored = [arm for arm in pruned if random.random() < self.exploration]
+        return kept + explored if kept else ordered
+
+    def record(self, context: str, tried: List[str], winner: Optional[str], passes: int):
+        """Registrar el resultado de un recorte"""
+        with self._lock:
+            stats = self._context_stats(context)
+            for arm in tried:
+                stats[arm].attempts += 1
+            if winner is not None:
+                stats[winner].wins += 1
+
+            counters = self._passes.setdefault(context, [0, 0])
+            counters[0] += 1
+            counters[1] += passes
+
+            self._dirty.add(context)
+            self._pending += 1
+            should_save = self._pending >= self.save_every
+
+        if should_save:
+            self.save()
+
+    def save(self):
+        """Persistir las estadísticas de los contextos modificados"""
+        with self._lock:
+            rows = [
+                (context, arm, s.attempts, s.wins)
+                for context in self._dirty
+                for arm, s in self._stats[context].items()
+            ]
+            self._dirty.clear()
+            self._pending = 0
+
+        if not rows:
+            return
+
+        try:
+            conn = sqlite3.connect(self.database_path, timeout=30)
+            conn.executemany('''
+                INSERT INTO ocr_strategy_stats (context, arm, attempts, wins) VALUES (?, ?, ?, ?)
+                ON CONFLICT (context, arm) DO UPDATE SET attempts = excluded.attempts, wins = excluded.wins
+            ''', rows)
+            conn.commit()
+            conn.close()
+        except sqlite3.Error as e:
+            print(f"[WARNING] Error guardando estadísticas de OCR: {e}")
+
+    def summary(self, context: str) -> dict:
+        """Resumen de un contexto: estrategias ordenadas por tasa de victoria y pasadas promedio"""
+        with self._lock:
+            stats = self._context_stats(context)
+            crops, passes = self._passes.get(context, [0, 0])
+            arms = sorted(
+                (
+                    {"arm": arm, "attempts": s.attempts, "wins": s.wins, "win_rate": round(s.win_rate, 3)}
+                    for arm, s in stats.items()
+                ),
+                key=lambda a: a["win_rate"],
+                reverse=True,
+            )
+
+        return {
+            "context": context,
+            "crops_processed": crops,
+            "avg_tesseract_passes": round(passes / crops, 2) if crops else None,
+            "arms": arms,
+        }
@@ -0,0 +1,262 @@
+"""Vistas previas anotadas y miniaturas de recortes, con caché en disco.
+
+El frontend necesita ver cada dorsal detectado y la foto con las cajas
+dibujadas. En vez de bajar el original completo y dibujar en el cliente, el
+servidor genera bajo demanda la foto anotada y la miniatura de cada detección
+al tamaño pedido. Lo generado, y los originales subidos de los que se genera,
+se guardan en disco con desalojo LRU acotado por tamaño total. La clave de
+caché sirve también de ETag: se calcula a partir de la foto, las detecciones y
+el tamaño, así que una vista repetida se responde con 304 sin leer el disco.
+"""
+import hashlib
+import os
+from abc import ABC, abstractmethod
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, List, Optional
+
+import cv2
+import numpy as np
+
+from config import PHOTO_STORE_MAX_BYTES, PREVIEW_CACHE_MAX_BYTES, PREVIEW_JPEG_QUALITY, PREVIEW_SIZE_STEP
+
+BOX_COLOR = (0, 200, 0)
+LABEL_TEXT_COLOR = (0, 0, 0)
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+# Factores de reducción que libjpeg aplica al decodificar (IMREAD_REDUCED_COLOR_*)
+REDUCED_READ_FLAGS = [
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+]
+
+
+class DiskLRU(ABC):
+    """Archivos en disco indexados por clave, con desalojo LRU por tamaño total.
+
+    Cada subclase define en _path dónde vive el archivo de una clave.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    @abstractmethod
+    def _path(self, key: str) -> Path:
+        """Ruta del archivo de una clave"""
+
+    def _load(self):
+        # Reconstruir el índice desde disco; la fecha de modificación marca el último uso
+        self.directory.mkdir(parents=True, exist_ok=True)
+        files = [p for p in self.directory.rglob("*") if p.is_file() and p.suffix != ".tmp"]
+        for path in sorted(files, key=lambda p: p.stat().st_mtime):
+            size = path.stat().st_size
+            self._entries[path.stem] = size
+            self._total_bytes += size
+        self._evict()
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self._path(key).unlink(missing_ok=True)
+
+    def _forget(self, key: str):
+        with self._lock:
+            size = self._entries.pop(key, None)
+            if size is not None:
+                self._total_bytes -= size
+
+    def _touch(self, key: str) -> bool:
+        """Marcar una entrada como recién usada; False si no está"""
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._entries.move_to_end(key)
+        try:
+            os.utime(self._path(key))
+            return True
+        except FileNotFoundError:
+            self._forget(key)
+            return False
+
+    def _write(self, key: str, data: bytes):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        temp.write_bytes(data)
+        os.replace(temp, path)
+        with self._lock:
+            self._total_bytes += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._evict()
+
+    def status(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._total_bytes, "max_bytes": self.max_bytes}
+
+
+class PhotoStore(DiskLRU):
+    """Originales de las fotos subidas, guardados por photo_id (hash del contenido).
+
+    Acotado como la caché de vistas previas: al pasar el máximo se descartan los
+    originales usados hace más tiempo, y sus vistas previas no cacheadas dan 404.
+    """
+
+    def __init__(self, root: Path, max_bytes: int = PHOTO_STORE_MAX_BYTES):
+        super().__init__(root, max_bytes)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / key
+
+    def save(self, photo_id: str, contents: bytes):
+        """Guardar el original si todavía no está (mismo contenido, mismo photo_id)"""
+        if not self._touch(photo_id):
+            self._write(photo_id, contents)
+
+    def find(self, photo_id: str, photo_path: Optional[str] = None) -> Optional[Path]:
+        """Ubicar el original: el guardado al subirlo o, si vino del daemon de ingesta, su ruta"""
+        if self._touch(photo_id):
+            return self._path(photo_id)
+        if photo_path and Path(photo_path).is_absolute() and Path(photo_path).is_file():
+            return Path(photo_path)
+        return None
+
+
+class PreviewCache(DiskLRU):
+    """Caché en disco de vistas previas generadas"""
+
+    def __init__(self, directory: Path, max_bytes: int = PREVIEW_CACHE_MAX_BYTES):
+        self._hits = 0
+        self._misses = 0
+        super().__init__(directory, max_bytes)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.jpg"
+
+    def get(self, key: str) -> Optional[bytes]:
+        if not self._touch(key):
+            self._misses += 1
+            return None
+        try:
+            data = self._path(key).read_bytes()
+        except FileNotFoundError:
+            self._forget(key)
+            self._misses += 1
+            return None
+        self._hits += 1
+        return data
+
+    def put(self, key: str, data: bytes):
+        self._write(key, data)
+
+    def get_or_render(self, key: str, render: Callable[[], bytes]) -> bytes:
+        """Devolver lo cacheado o generarlo y guardarlo"""
+        data = self.get(key)
+        if data is None:
+            data = render()
+            self.put(key, data)
+        return data
+
+    def status(self) -> dict:
+        return {**super().status(), "hits": self._hits, "misses": self._misses}
+
+
+def quantize_size(size: int, maximum: int, step: int = PREVIEW_SIZE_STEP) -> int:
+    """Redondear el tamaño pedido al paso y acotarlo, para no cachear infinitas variantes"""
+    size = max(step, min(maximum, size))
+    return min(maximum, -(-size // step) * step)
+
+
+def preview_key(kind: str, photo_id: str, size: int, detections: List[dict]) -> str:
+    """Clave de caché y ETag: cambia si cambia la foto, el tamaño o alguna detección"""
+    digest = hashlib.sha256(f"{kind}|{photo_id}|{size}|{PREVIEW_JPEG_QUALITY}".encode())
+    for detection in detections:
+        c = detection["coordinates"]
+        digest.update(
+            f"|{detection['detection_id']}:{detection['plate_number']}:{c['x1']},{c['y1']},{c['x2']},{c['y2']}".encode()
+        )
+    return digest.hexdigest()[:32]
+
+
+def _read_reduced(path: Path, scale: float):
+    """Decodificar con la mayor reducción de libjpeg que no baje de la escala pedida"""
+    for factor, flag in REDUCED_READ_FLAGS:
+        if 1 / factor >= scale:
+            image = cv2.imread(str(path), flag)
+            if image is not None:
+                return image, 1 / factor
+    return cv2.imread(str(path), cv2.IMREAD_COLOR), 1.0
+
+
+def _image_size(path: Path):
+    # Sólo el encabezado; el lado menor sirve aunque la orientación EXIF rote la foto
+    from PIL import Image
+
+    with Image.open(path) as img:
+        return img.size
+
+
+def _encode(image: np.ndarray) -> bytes:
+    ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, PREVIEW_JPEG_QUALITY])
+    if not ok:
+        raise ValueError("No se pudo codificar la vista previa")
+    return buffer.tobytes()
+
+
+def render_annotated(path: Path, detections: List[dict], width: int) -> bytes:
+    """Foto reducida al ancho pedido con las cajas y el dorsal de cada detección"""
+    image, read_scale = _read_reduced(path, width / min(_image_size(path)))
+    if image is None:
+        raise ValueError("No se pudo leer la foto original")
+
+    height, current_width = image.shape[:2]
+    resize = min(1.0, width / current_width)
+    if resize < 1.0:
+        image = cv2.resize(image, (int(current_width * resize), int(height * resize)), interpolation=cv2.INTER_AREA)
+    scale = read_scale * resize
+
+    thickness = max(2, image.shape[1] // 400)
+    font_scale = max(0.5, image.shape[1] / 1600)
+    for detection in detections:
+        c = detection["coordinates"]
+        x1, y1 = int(c["x1"] * scale), int(c["y1"] * scale)
+        x2, y2 = int(c["x2"] * scale), int(c["y2"] * scale)
+        cv2.rectangle(image, (x1, y1), (x2, y2), BOX_COLOR, thickness)
+
+        label = str(detection["plate_number"])
+        (text_width, text_height), baseline = cv2.getTextSize(label, FONT, font_scale, thickness)
+        label_top = max(0, y1 - text_height - baseline - thickness)
+        cv2.rectangle(image, (x1, label_top), (x1 + text_width + 2 * thickness, label_top + text_height + baseline + thickness),
+                      BOX_COLOR, cv2.FILLED)
+        cv2.putText(image, label, (x1 + thickness, label_top + text_height + thickness // 2),
+                    FONT, font_scale, LABEL_TEXT_COLOR, thickness, cv2.LINE_AA)
+    return _encode(image)
+
+
+def render_crop(path: Path, coordinates: dict, size: int) -> bytes:
+    """Miniatura del recorte de una detección, con su lado mayor igual a size"""
+    crop_width = max(1, coordinates["x2"] - coordinates["x1"])
+    crop_height = max(1, coordinates["y2"] - coordinates["y1"])
+    image, scale = _read_reduced(path, min(1.0, size / max(crop_width, crop_height)))
+    if image is None:
+        raise ValueError("No se pudo leer la foto original")
+
+    height, width = image.shape[:2]
+    x1, y1 = max(0, int(coordinates["x1"] * scale)), max(0, int(coordinates["y1"] * scale))
+    x2, y2 = min(width, int(coordinates["x2"] * scale)), min(height, int(coordinates["y2"] * scale))
+    crop = image[y1:y2, x1:x2]
+    if crop.size == 0:
+        raise ValueError("La detección está fuera de la foto")
+
+    resize = min(1.0, size / max(crop.shape[:2]))
+    if resize < 1.0:
+        crop = cv2.resize(crop, (max(1, int(crop.shape[1] * resize)), max(1, int(crop.shape[0] * resize))),
+                          interpolation=cv2.INTER_AREA)
+    return _encode(crop)
@@ -0,0 +1,212 @@
+"""Perfilado bajo demanda de requests individuales.
+
+Un request se perfila si trae el encabezado X-Profile o si le toca por
+muestreo (uno de cada N). Por defecto se muestrea la pila del hilo que atiende
+el request cada pocos milisegundos y se guarda en formato de pilas colapsadas
+(.folded), que leen flamegraph.pl y speedscope. Con "X-Profile: cprofile" se
+guarda en cambio un perfil de cProfile (.prof). Sin perfilado activo el costo
+es revisar un encabezado y un contador.
+
+El trabajo pesado corre en hilos del pipeline, no en el del event loop: el
+perfil del request viaja en una contextvar y bind_profile() envuelve la función
+que se manda al hilo para que ese hilo también quede perfilado mientras la
+ejecuta.
+"""
+import cProfile
+import functools
+import itertools
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Callable, Optional
+
+from config import PROFILE_HEADER, PROFILE_SAMPLE_EVERY, PROFILE_SAMPLE_INTERVAL
+
+
+class StackSampler:
+    """Muestrea periódicamente la pila de los hilos que trabajan para un request"""
+
+    def __init__(self, interval: float = PROFILE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        # ident -> nombre del hilo; la raíz de cada pila es el nombre del hilo
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def add_thread(self, thread: threading.Thread):
+        with self._lock:
+            self._threads[thread.ident] = thread.name
+
+    def remove_thread(self, thread: threading.Thread):
+        with self._lock:
+            self._threads.pop(thread.ident, None)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                threads = dict(self._threads)
+            current_frames = sys._current_frames()
+            for thread_id, thread_name in threads.items():
+                frame = current_frames.get(thread_id)
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if frames:
+                    self.stacks[";".join([thread_name] + frames[::-1])] += 1
+
+    def write(self, path: Path):
+        """Guardar en formato de pilas colapsadas: "a;b;c cantidad" por línea"""
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class RequestProfile:
+    """Perfil de un request que abarca el hilo del event loop y los hilos del pipeline"""
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.sampler = StackSampler() if mode == "sample" else None
+        self.profilers = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self.sampler:
+            self.sampler.add_thread(threading.current_thread())
+            self.sampler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            self.profilers.append(profiler)
+
+    def stop(self):
+        if self.sampler:
+            self.sampler.stop()
+        else:
+            self.profilers[0].disable()
+
+    def run(self, func: Callable, *args, **kwargs):
+        """Ejecutar func en el hilo actual incluyéndolo en el perfil"""
+        if self.sampler:
+            thread = threading.current_thread()
+            self.sampler.add_thread(thread)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.sampler.remove_thread(thread)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Desde Python 3.12 cProfile es global: el perfil del event loop ya cubre este hilo
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.disable()
+            with self._lock:
+                self.profilers.append(profiler)
+
+    def write(self, path: Path):
+        if self.sampler:
+            self.sampler.write(path)
+            return
+        # Un único .prof con las llamadas de todos los hilos
+        with self._lock:
+            stats = pstats.Stats(self.profilers[0])
+            for profiler in self.profilers[1:]:
+                stats.add(profiler)
+        stats.dump_stats(str(path))
+
+
+_current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+
+
+def bind_profile(func: Callable) -> Callable:
+    """Envolver func para que, al ejecutarse en otro hilo, entre en el perfil del request actual"""
+    profile = _current_profile.get()
+    if profile is None:
+        return func
+    return functools.partial(profile.run, func)
+
+
+class ProfilingMiddleware:
+    """Middleware ASGI que perfila requests marcados o muestreados"""
+
+    def __init__(self, app, output_dir: Path, sample_every: int = PROFILE_SAMPLE_EVERY,
+                 header: str = PROFILE_HEADER):
+        self.app = app
+        self.output_dir = output_dir
+        self.sample_every = sample_every
+        self.header = header.lower().encode("latin-1")
+        self._counter = itertools.count(1)
+        # cProfile no admite dos perfiles activos en el mismo hilo
+        self._cprofile_active = False
+
+    def _profile_mode(self, scope) -> Optional[str]:
+        for name, value in scope.get("headers", []):
+            if name == self.header:
+                value = value.decode("latin-1").strip().lower()
+                return "cprofile" if value == "cprofile" else "sample"
+        if self.sample_every and next(self._counter) % self.sample_every == 0:
+            return "sample"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        mode = self._profile_mode(scope)
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+        if mode == "cprofile" and self._cprofile_active:
+            mode = "sample"
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "-", scope["path"]).strip("-") or "root"
+        extension = "prof" if mode == "cprofile" else "folded"
+        path = self.output_dir / f"{time.strftime('%Y%m%d-%H%M%S')}-{scope['method']}-{slug}-{id(scope):x}.{extension}"
+
+        # Informar al cliente dónde quedará el perfil
+        async def send_with_header(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-profile-file", path.name.encode("latin-1"))]
+            await send(message)
+
+        start = time.perf_counter()
+        profile = RequestProfile(mode)
+        if mode == "cprofile":
+            self._cprofile_active = True
+        token = _current_profile.set(profile)
+        profile.start()
+        try:
+            await self.app(scope, receive, send_with_header)
+        finally:
+            profile.stop()
+            _current_profile.reset(token)
+            if mode == "cprofile":
+                self._cprofile_active = False
+            profile.write(path)
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"[PROFILE] {scope['method']} {scope['path']} {elapsed_ms:.0f}ms -> {path}")
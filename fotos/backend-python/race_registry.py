@@ -0,0 +1,201 @@
+"""Registros de corredores particionados por carrera.
+
+Los números de dorsal se repiten entre eventos, así que cada carrera tiene su
+propio registro. El registro de una carrera se carga en memoria la primera vez
+que se usa y se descarta cuando queda inactivo, para que la carrera activa
+responda desde memoria sin mantener todo el historial cargado.
+
+Cada carrera tiene una versión que sube al registrar corredores; los procesos
+que la tienen en memoria la comparan cada pocos segundos, así que lo cargado
+desde otro worker de uvicorn o desde el CLI llega sin reiniciar.
+
+Los corredores de una carrera se cargan con POST /races/{race_id}/runners o
+desde un CSV (columnas plate_number, runner_name):
+
+    python race_registry.py maraton-2025 inscriptos.csv
+"""
+import argparse
+import csv
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import (
+    DEFAULT_RACE_ID,
+    RACE_REGISTRY_CHECK_SECONDS,
+    RACE_REGISTRY_IDLE_SECONDS,
+    RACE_REGISTRY_MAX_RACES,
+)
+
+
+def init_race_tables(database_path: Path):
+    """Crear la tabla de corredores por carrera y migrar los corredores existentes"""
+    conn = sqlite3.connect(database_path)
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS race_runners (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            race_id TEXT NOT NULL,
+            plate_number TEXT NOT NULL,
+            runner_name TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (race_id, plate_number)
+        )
+    ''')
+
+    # Versión por carrera para detectar cambios hechos por otros procesos
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS race_versions (
+            race_id TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Los corredores de la tabla global (si existe) pasan a la carrera por defecto
+    cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'runners'")
+    has_legacy_table = cursor.fetchone()[0] > 0
+    cursor.execute('SELECT COUNT(*) FROM race_runners WHERE race_id = ?', (DEFAULT_RACE_ID,))
+    if has_legacy_table and cursor.fetchone()[0] == 0:
+        cursor.execute('''
+            INSERT OR IGNORE INTO race_runners (race_id, plate_number, runner_name)
+            SELECT ?, plate_number, runner_name FROM runners
+        ''', (DEFAULT_RACE_ID,))
+
+    conn.commit()
+    conn.close()
+
+
+class RaceRegistryCache:
+    """Caché de registros de corredores por carrera con expulsión por inactividad"""
+
+    def __init__(self, database_path: Path, idle_seconds: float = RACE_REGISTRY_IDLE_SECONDS,
+                 max_races: int = RACE_REGISTRY_MAX_RACES, check_seconds: float = RACE_REGISTRY_CHECK_SECONDS):
+        self.database_path = database_path
+        self.idle_seconds = idle_seconds
+        self.max_races = max_races
+        self.check_seconds = check_seconds
+        # race_id -> (dorsal -> nombre, último uso, versión, última verificación de la versión)
+        self._races: "OrderedDict[str, Tuple[Dict[str, str], float, int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _read_version(cursor: sqlite3.Cursor, race_id: str) -> int:
+        cursor.execute('SELECT version FROM race_versions WHERE race_id = ?', (race_id,))
+        row = cursor.fetchone()
+        return row[0] if row else 0
+
+    def _version(self, race_id: str) -> int:
+        conn = sqlite3.connect(self.database_path)
+        version = self._read_version(conn.cursor(), race_id)
+        conn.close()
+        return version
+
+    def _load(self, race_id: str) -> Tuple[Dict[str, str], int]:
+        conn = sqlite3.connect(self.database_path)
+        cursor = conn.cursor()
+        # Versión y corredores en la misma transacción de lectura
+        cursor.execute('BEGIN')
+        version = self._read_version(cursor, race_id)
+        cursor.execute('SELECT plate_number, runner_name FROM race_runners WHERE race_id = ?', (race_id,))
+        runners = dict(cursor.fetchall())
+        conn.rollback()
+        conn.close()
+        return runners, version
+
+    def _evict(self, now: float):
+        # Expulsar carreras inactivas y, si aún sobran, las menos usadas
+        for race_id in [r for r, entry in self._races.items() if now - entry[1] > self.idle_seconds]:
+            del self._races[race_id]
+        while len(self._races) > self.max_races:
+            self._races.popitem(last=False)
+
+    def get_registry(self, race_id: str) -> Dict[str, str]:
+        """Obtener el registro de una carrera, cargándolo si no está en memoria o si cambió"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._races.get(race_id)
+            if entry is not None:
+                runners, _, version, checked_at = entry
+                fresh = now - checked_at < self.check_seconds
+                self._races[race_id] = (runners, now, version, checked_at)
+                self._races.move_to_end(race_id)
+                self._evict(now)
+                if fresh:
+                    return runners
+
+        # Verificar la versión y cargar fuera del lock para no bloquear a otras carreras
+        if entry is not None and self._version(race_id) == entry[2]:
+            with self._lock:
+                if race_id in self._races:
+                    self._races[race_id] = (entry[0], now, entry[2], now)
+            return entry[0]
+
+        runners, version = self._load(race_id)
+
+        with self._lock:
+            self._races[race_id] = (runners, now, version, now)
+            self._races.move_to_end(race_id)
+            self._evict(now)
+        return runners
+
+    def get_runner(self, race_id: str, plate_number: str) -> Optional[str]:
+        """Buscar el nombre de un corredor dentro de una carrera"""
+        return self.get_registry(race_id).get(plate_number)
+
+    def invalidate(self, race_id: str):
+        """Descartar el registro en memoria de una carrera"""
+        with self._lock:
+            self._races.pop(race_id, None)
+
+    def loaded_races(self) -> List[str]:
+        """Carreras actualmente en memoria"""
+        with self._lock:
+            return list(self._races.keys())
+
+    def register_runners(self, race_id: str, runners: Iterable[Tuple[str, str]]) -> int:
+        """Registrar (dorsal, nombre) en una carrera e invalidar su caché; devuelve cuántos se guardaron"""
+        rows = [(race_id, str(plate).strip(), str(name).strip()) for plate, name in runners]
+        rows = [row for row in rows if row[1] and row[2]]
+        conn = sqlite3.connect(self.database_path)
+        conn.executemany('''
+            INSERT INTO race_runners (race_id, plate_number, runner_name) VALUES (?, ?, ?)
+            ON CONFLICT (race_id, plate_number) DO UPDATE SET runner_name = excluded.runner_name
+        ''', rows)
+        # Avisar a los demás procesos que tienen la carrera en memoria
+        conn.execute('''
+            INSERT INTO race_versions (race_id, version) VALUES (?, 1)
+            ON CONFLICT (race_id) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+        ''', (race_id,))
+        conn.commit()
+        conn.close()
+        self.invalidate(race_id)
+        return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cargar los corredores de una carrera desde un CSV")
+    parser.add_argument("race_id")
+    parser.add_argument("csv_file", type=Path, help="CSV con columnas plate_number y runner_name")
+    parser.add_argument("--database", type=Path,
+                        default=Path(__file__).parent.parent / "database" / "runners.db")
+    args = parser.parse_args()
+
+    with open(args.csv_file, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        if not reader.fieldnames or not {"plate_number", "runner_name"} <= set(reader.fieldnames):
+            parser.error("El CSV debe tener las columnas plate_number y runner_name")
+        runners = [(row["plate_number"], row["runner_name"]) for row in reader]
+
+    args.database.parent.mkdir(parents=True, exist_ok=True)
+    init_race_tables(args.database)
+    count = RaceRegistryCache(args.database).register_runners(args.race_id, runners)
+    print(f"[OK] {count} corredores registrados en la carrera {args.race_id}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 import uvicorn
 import cv2
 import numpy as np
@@ -8,10 +9,19 @@ import pytesseract
 import sqlite3
 import re
 from pathlib import Path
+from admission import AdmissionController, AdmissionMiddleware
+from profiling import ProfilingMiddleware, bind_profile
 
 # Configuración básica
 app = FastAPI(title="Grow Labs Races API")
 
+# Perfilado bajo demanda
+app.add_middleware(ProfilingMiddleware, output_dir=Path(__file__).parent.parent / "profiles")
+
+# Control de admisión
+admission = AdmissionController()
+app.add_middleware(AdmissionMiddleware, controller=admission)
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -103,7 +113,7 @@ async def root():
 
 @app.get("/health")
 async def health():
-    return {"status": "ok", "database": DATABASE_PATH.exists()}
+    return {"status": "ok", "database": DATABASE_PATH.exists(), "admission": admission.status()}
 
 @app.post("/detect-plate")
 async def detect_plate(file: UploadFile = File(...)):
@@ -111,13 +121,13 @@ async def detect_plate(file: UploadFile = File(...)):
         # Leer imagen
         contents = await file.read()
         nparr = np.frombuffer(contents, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        image = await run_in_threadpool(bind_profile(cv2.imdecode), nparr, cv2.IMREAD_COLOR)
         
         if image is None:
             raise HTTPException(status_code=400, detail="Imagen inválida")
         
-        # Extraer texto de toda la imagen
-        plate_text = extract_text(image)
+        # Extraer texto de toda la imagen, fuera del event loop
+        plate_text = await run_in_threadpool(bind_profile(extract_text), image)
         
         if plate_text:
             runner_name = get_runner(plate_text)
@@ -0,0 +1,46 @@
+"""Reporte de tiempos de arranque.
+
+Registra cuánto tarda cada import pesado y cada fase de inicialización, para
+saber cuándo un worker nuevo queda listo para recibir tráfico. Para el detalle
+de todos los imports se puede usar además `python -X importtime main.py`.
+"""
+import importlib
+import sys
+import time
+from contextlib import contextmanager
+
+# Aproximación al inicio del proceso: el primer import de este módulo
+_STARTED_AT = time.perf_counter()
+
+_imports = {}
+_phases = {}
+
+
+def import_timed(name: str):
+    """Importar un módulo registrando el tiempo que tomó la primera vez"""
+    if name in sys.modules:
+        return sys.modules[name]
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    _imports[name] = time.perf_counter() - start
+    print(f"[STARTUP] import {name}: {_imports[name]:.2f}s")
+    return module
+
+
+@contextmanager
+def timed_phase(name: str):
+    """Medir una fase de inicialización"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases[name] = time.perf_counter() - start
+
+
+def report() -> dict:
+    """Tiempos de import y de cada fase, en segundos"""
+    return {
+        "seconds_since_start": round(time.perf_counter() - _STARTED_AT, 3),
+        "imports": {name: round(seconds, 3) for name, seconds in _imports.items()},
+        "phases": {name: round(seconds, 3) for name, seconds in _phases.items()},
+    }